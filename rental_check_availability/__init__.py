@@ -1,3 +1,4 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 
+from .hooks import fill_rental_occupancy
 from . import models
@@ -24,7 +24,7 @@ To use this module, you need to:
 * Ben Brich <b.brich@humanilog.org> (www.humanilog.org)
 * Yu Weng <yweng@elegosoft.com> (www.elegosoft.com)
 """,
-    "version": "12.0.1.0.1",
+    "version": "12.0.1.2.0",
     "category": "Rental",
     "author": "Odoo Community Association (OCA), Elego Software Solutions GmbH",
     "website": "https://github.com/OCA/vertical-rental",
@@ -32,10 +32,15 @@ To use this module, you need to:
         "rental_pricelist",
     ],
     "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/sale_view.xml",
+        "views/product_view.xml",
+        "views/res_company_view.xml",
     ],
     "demo": [],
     "qweb": [],
+    "post_init_hook": "fill_rental_occupancy",
     "application": False,
     "license": "AGPL-3",
 }
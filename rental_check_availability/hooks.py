@@ -0,0 +1,9 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import SUPERUSER_ID
+from odoo.api import Environment
+
+
+def fill_rental_occupancy(cr, registry):
+    env = Environment(cr, SUPERUSER_ID, {})
+    env["rental.occupancy.day"]._rebuild_occupancy()
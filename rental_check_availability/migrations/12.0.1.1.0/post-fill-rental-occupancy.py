@@ -0,0 +1,7 @@
+from odoo import SUPERUSER_ID
+from odoo.api import Environment
+
+
+def migrate(cr, version):
+    env = Environment(cr, SUPERUSER_ID, {})
+    env["rental.occupancy.day"]._rebuild_occupancy()
@@ -0,0 +1,14 @@
+from odoo import SUPERUSER_ID
+from odoo.api import Environment
+
+
+def migrate(cr, version):
+    env = Environment(cr, SUPERUSER_ID, {})
+    cr.execute(
+        """
+        SELECT product_id, MIN(day), MAX(day)
+        FROM rental_occupancy_day
+        GROUP BY product_id
+        """
+    )
+    env["rental.occupancy.change"]._add_changes(cr.fetchall())
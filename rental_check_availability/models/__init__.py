@@ -1,2 +1,7 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 from . import sale
+from . import rental_occupancy_day
+from . import rental_occupancy_change
+from . import rental_occupancy_version
+from . import product
+from . import res_company
@@ -0,0 +1,184 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import _, api, exceptions, fields, models
+from odoo.addons import decimal_precision as dp
+from odoo.addons.stock.models.product import OPERATORS
+
+
+class ProductProduct(models.Model):
+    _inherit = "product.product"
+
+    rental_free_qty = fields.Float(
+        string="Free to Rent",
+        help="Quantity in the rental location which is not rented out in the "
+        "period given by the context keys 'rental_start_date' and "
+        "'rental_end_date' (today by default).",
+        compute="_compute_rental_free_qty",
+        search="_search_rental_free_qty",
+        digits=dp.get_precision("Product Unit of Measure"),
+    )
+
+    @api.model
+    def _get_rental_search_period(self):
+        today = fields.Date.context_today(self)
+        date_start = fields.Date.to_date(self.env.context.get("rental_start_date"))
+        date_end = fields.Date.to_date(self.env.context.get("rental_end_date"))
+        return date_start or today, date_end or date_start or today
+
+    @api.multi
+    def _compute_rental_free_qty(self):
+        date_start, date_end = self._get_rental_search_period()
+        free_qties = self._get_rental_free_qties(
+            date_start, date_end, self.env.context.get("warehouse"), self.ids
+        )
+        for product in self:
+            product.rental_free_qty = free_qties.get(product.id, 0.0)
+
+    def _search_rental_free_qty(self, operator, value):
+        if operator not in OPERATORS:
+            raise exceptions.UserError(_("Invalid domain operator %s") % operator)
+        date_start, date_end = self._get_rental_search_period()
+        free_qties = self._get_rental_free_qties(
+            date_start, date_end, self.env.context.get("warehouse")
+        )
+        product_ids = [
+            product_id
+            for product_id, qty in free_qties.items()
+            if OPERATORS[operator](qty, value)
+        ]
+        return [("id", "in", product_ids)]
+
+    @api.model
+    def get_rental_free_products(
+        self, date_start, date_end, min_qty=1, warehouse_id=False
+    ):
+        """Return the ids of the rentable products with at least min_qty
+        units free in the rental location during the whole period.
+        """
+        free_qties = self._get_rental_free_qties(
+            fields.Date.to_date(date_start),
+            fields.Date.to_date(date_end),
+            warehouse_id,
+        )
+        return [product_id for product_id, qty in free_qties.items() if qty >= min_qty]
+
+    @api.model
+    def _get_rental_free_qties(
+        self, date_start, date_end, warehouse_id=False, product_ids=None
+    ):
+        """Return the free quantity of the rentable products in a period.
+
+        The whole catalog is evaluated at once: the stock of the rental
+        location, read as for the availability check of the order lines,
+        minus the peak occupancy of the period grouped by product, read from
+        the occupancy ledger.
+
+        :param product_ids: restrict the result to these products, all
+            rentable storable products by default
+        :return: dict mapping product ids to their free quantity
+        """
+        if product_ids is None:
+            product_ids = self.search(
+                [("rental", "=", True), ("type", "=", "product")]
+            ).ids
+        if not product_ids:
+            return {}
+        product_ids = tuple(product_ids)
+        warehouse = self._get_rental_warehouse(warehouse_id)
+        stock_qties = self.browse(product_ids)._get_rental_stock_qties(warehouse)
+        cr = self.env.cr
+        cr.execute(
+            """
+            SELECT occupancy.product_id, MAX(occupancy.qty)
+            FROM (
+                SELECT product_id, SUM(reserved_qty + confirmed_qty) AS qty
+                FROM rental_occupancy_day
+                WHERE product_id IN %s AND day BETWEEN %s AND %s
+                GROUP BY product_id, day
+            ) AS occupancy
+            GROUP BY occupancy.product_id
+            """,
+            (product_ids, date_start, date_end),
+        )
+        occupied_qties = dict(cr.fetchall())
+        return {
+            product_id: stock_qties[product_id]
+            - float(occupied_qties.get(product_id, 0))
+            for product_id in product_ids
+        }
+
+    @api.model
+    def _get_rental_warehouse(self, warehouse_id=False):
+        if warehouse_id:
+            return self.env["stock.warehouse"].browse(warehouse_id)
+        return self.env["stock.warehouse"].search(
+            [("company_id", "=", self.env.user.company_id.id)], limit=1
+        )
+
+    @api.multi
+    def _get_rental_stock_qties(self, warehouse):
+        """Return the quantity on hand in the rental location per product id."""
+        qties = self._get_rental_location_qties(warehouse.rental_view_location_id.id)
+        return {
+            product.id: qties.get(product.id, {}).get("qty_available", 0.0)
+            for product in self
+        }
+
+    @api.multi
+    def _get_rental_warehouse_stock_qties(self, warehouses):
+        """Return the quantity on hand in the rental location of each of the
+        given warehouses with one grouped query, counting the same quants as
+        _get_rental_location_qties().
+
+        :return: dict mapping tuples (product_id, warehouse_id) to quantities
+        """
+        if not self or not warehouses:
+            return {}
+        self.env.cr.execute(
+            """
+            SELECT q.product_id, w.id, SUM(q.quantity)
+            FROM stock_quant q
+            JOIN stock_location l ON l.id = q.location_id
+            JOIN stock_warehouse w ON w.id IN %s
+            JOIN stock_location rl ON rl.id = w.rental_view_location_id
+            WHERE q.product_id IN %s
+                AND l.parent_path LIKE rl.parent_path || '%%'
+            GROUP BY q.product_id, w.id
+            """,
+            (tuple(warehouses.ids), tuple(self.ids)),
+        )
+        return {
+            (product_id, warehouse_id): float(qty)
+            for product_id, warehouse_id, qty in self.env.cr.fetchall()
+        }
+
+    @api.multi
+    def get_rental_availability_calendar(
+        self, date_start=False, days=180, warehouse_id=False
+    ):
+        """Return the free quantity per day of the products for a horizon.
+
+        The occupancy of the days comes from the occupancy ledger, as for
+        the availability check of the order lines, and is subtracted from
+        the stock.
+
+        :param date_start: first day of the horizon, today by default
+        :param days: number of days of the horizon
+        :param warehouse_id: warehouse of the rental location, the first
+            warehouse of the company by default
+        :return: dict mapping each product id to the list of its free
+            quantities, starting with the one of date_start
+        """
+        date_start = fields.Date.to_date(date_start) or fields.Date.context_today(self)
+        date_end = date_start + relativedelta(days=days - 1)
+        warehouse = self._get_rental_warehouse(warehouse_id)
+        stock_qties = self._get_rental_stock_qties(warehouse)
+        occupancies = self.env["rental.occupancy.day"]._get_daily_occupied_rows(
+            self.ids, date_start, date_end
+        )
+        res = {product.id: [stock_qties[product.id]] * days for product in self}
+        for product_id, day, qty in occupancies:
+            res[product_id][(day - date_start).days] -= qty
+        return res
@@ -0,0 +1,74 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models
+
+
+class RentalOccupancyChange(models.Model):
+    _name = "rental.occupancy.change"
+    _description = "Rented Products with a Changed Occupancy"
+    _log_access = False
+
+    product_id = fields.Many2one(
+        comodel_name="product.product",
+        string="Rented Product",
+        required=True,
+        ondelete="cascade",
+    )
+
+    start_date = fields.Date(
+        string="Start Date",
+        required=True,
+    )
+
+    end_date = fields.Date(
+        string="End Date",
+        required=True,
+    )
+
+    @api.model
+    def _add_changes(self, values):
+        """Record that the occupancy of the given products changed.
+
+        :param values: list of tuples (product_id, start_date, end_date) of
+            the changed periods
+        """
+        if not values:
+            return
+        product_ids, start_dates, end_dates = [list(column) for column in zip(*values)]
+        self.env.cr.execute(
+            """
+            INSERT INTO rental_occupancy_change (product_id, start_date, end_date)
+            SELECT product_id, MIN(start_date), MAX(end_date)
+            FROM unnest(%s::integer[], %s::date[], %s::date[])
+                AS c(product_id, start_date, end_date)
+            GROUP BY product_id
+            """,
+            (product_ids, start_dates, end_dates),
+        )
+
+    @api.model
+    def _pop_changes(self):
+        """Return the periods whose occupancy changed since the last call per
+        product and forget about them.
+
+        Only committed changes are returned, the ones of running transactions
+        are kept for the next call.
+
+        :return: dict mapping product ids to tuples (start_date, end_date)
+            spanning their changed days
+        """
+        self.env.cr.execute(
+            """
+            WITH changes AS (
+                DELETE FROM rental_occupancy_change
+                RETURNING product_id, start_date, end_date
+            )
+            SELECT product_id, MIN(start_date), MAX(end_date)
+            FROM changes
+            GROUP BY product_id
+            """
+        )
+        return {
+            product_id: (start_date, end_date)
+            for product_id, start_date, end_date in self.env.cr.fetchall()
+        }
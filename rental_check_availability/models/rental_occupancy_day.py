@@ -0,0 +1,316 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from collections import defaultdict
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+from odoo.addons import decimal_precision as dp
+from odoo.tools import sql
+
+# first key of the advisory locks of the rented products ("RENT")
+RENTAL_PRODUCT_LOCK = 0x52454E54
+
+
+class RentalOccupancyDay(models.Model):
+    _name = "rental.occupancy.day"
+    _description = "Daily Occupancy of Rented Products"
+    _order = "product_id, warehouse_id, day"
+
+    product_id = fields.Many2one(
+        comodel_name="product.product",
+        string="Rented Product",
+        required=True,
+        ondelete="cascade",
+    )
+
+    warehouse_id = fields.Many2one(
+        comodel_name="stock.warehouse",
+        string="Warehouse",
+        required=True,
+        ondelete="cascade",
+    )
+
+    day = fields.Date(
+        string="Day",
+        required=True,
+    )
+
+    reserved_qty = fields.Float(
+        string="Reserved Quantity",
+        help="Quantity of the product rented out on this day by quotations.",
+        digits=dp.get_precision("Product Unit of Measure"),
+    )
+
+    confirmed_qty = fields.Float(
+        string="Confirmed Quantity",
+        help="Quantity of the product rented out on this day by confirmed orders.",
+        digits=dp.get_precision("Product Unit of Measure"),
+    )
+
+    _sql_constraints = [
+        (
+            "product_warehouse_day_uniq",
+            "UNIQUE(product_id, warehouse_id, day)",
+            "There can only be one occupancy per product, warehouse and day.",
+        ),
+    ]
+
+    @api.model_cr
+    def init(self):
+        sql.create_index(
+            self._cr,
+            "rental_occupancy_day_product_id_day_index",
+            self._table,
+            ["product_id", "day"],
+        )
+
+    @api.model
+    def _add_occupancy(self, values, sign=1):
+        """Add the given occupancies to the ledger day by day.
+
+        :param values: list of tuples (product_id, warehouse_id, start_date,
+            end_date, reserved_qty, confirmed_qty) as returned by
+            sale.order.line _get_rental_occupancy_values()
+        :param sign: 1 to add the occupancies, -1 to remove them, the days
+            which are not occupied anymore are then deleted
+        """
+        if not values:
+            return
+        product_ids, warehouse_ids, start_dates, end_dates, reserved, confirmed = [
+            list(column) for column in zip(*values)
+        ]
+        self.env.cr.execute(
+            """
+            INSERT INTO rental_occupancy_day
+                (product_id, warehouse_id, day, reserved_qty, confirmed_qty)
+            SELECT o.product_id, o.warehouse_id, d.day::date,
+                SUM(o.reserved_qty) * %s, SUM(o.confirmed_qty) * %s
+            FROM unnest(
+                %s::integer[], %s::integer[], %s::date[], %s::date[],
+                %s::numeric[], %s::numeric[]
+            ) AS o(
+                product_id, warehouse_id, start_date, end_date,
+                reserved_qty, confirmed_qty
+            ),
+            generate_series(
+                o.start_date::timestamp, o.end_date::timestamp, interval '1 day'
+            ) AS d(day)
+            GROUP BY o.product_id, o.warehouse_id, d.day
+            ON CONFLICT (product_id, warehouse_id, day) DO UPDATE SET
+                reserved_qty =
+                    rental_occupancy_day.reserved_qty + EXCLUDED.reserved_qty,
+                confirmed_qty =
+                    rental_occupancy_day.confirmed_qty + EXCLUDED.confirmed_qty
+            """,
+            (
+                sign,
+                sign,
+                product_ids,
+                warehouse_ids,
+                start_dates,
+                end_dates,
+                reserved,
+                confirmed,
+            ),
+        )
+        if sign < 0:
+            # days which are not occupied anymore
+            self.env.cr.execute(
+                """
+                DELETE FROM rental_occupancy_day
+                WHERE product_id IN %s
+                    AND day BETWEEN %s AND %s
+                    AND reserved_qty = 0
+                    AND confirmed_qty = 0
+                """,
+                (tuple(product_ids), min(start_dates), max(end_dates)),
+            )
+        self.invalidate_cache(fnames=["reserved_qty", "confirmed_qty"])
+        self.env["rental.occupancy.change"]._add_changes(
+            list(zip(product_ids, start_dates, end_dates))
+        )
+
+    @api.model
+    def _get_max_occupied_qty(self, product_id, start_date, end_date, own_values=False):
+        """Return the peak quantity of a product rented out in the given period.
+
+        :param own_values: occupancy tuple of the line being checked, which
+            is not counted in the result
+        """
+        own_start = own_end = None
+        own_qty = 0.0
+        if own_values:
+            own_start, own_end = own_values[2], own_values[3]
+            own_qty = own_values[4] + own_values[5]
+        self.env.cr.execute(
+            """
+            SELECT COALESCE(MAX(occupancy.qty), 0)
+            FROM (
+                SELECT SUM(reserved_qty + confirmed_qty) - CASE
+                    WHEN day BETWEEN %s AND %s THEN %s::numeric ELSE 0
+                END AS qty
+                FROM rental_occupancy_day
+                WHERE product_id = %s AND day BETWEEN %s AND %s
+                GROUP BY day
+            ) AS occupancy
+            """,
+            (own_start, own_end, own_qty, product_id, start_date, end_date),
+        )
+        return float(self.env.cr.fetchone()[0])
+
+    @api.model
+    def _get_daily_occupied_qties(
+        self, product_id, start_date, end_date, own_values=False
+    ):
+        """Return the quantity of a product rented out on each day of the
+        given period, as a list starting with the one of start_date.
+
+        :param own_values: occupancy tuple of the line being checked, which
+            is not counted in the result
+        """
+        qties = [0.0] * ((end_date - start_date).days + 1)
+        for _product_id, day, qty in self._get_daily_occupied_rows(
+            [product_id], start_date, end_date
+        ):
+            qties[(day - start_date).days] = qty
+        if own_values:
+            own_qty = own_values[4] + own_values[5]
+            for index in range(len(qties)):
+                day = start_date + relativedelta(days=index)
+                if own_values[2] <= day <= own_values[3]:
+                    qties[index] -= own_qty
+        return qties
+
+    @api.model
+    def _get_daily_occupied_rows(self, product_ids, start_date, end_date):
+        """Return the quantities of the products rented out on the days of
+        the given period in all warehouses, with one query.
+
+        :return: list of tuples (product_id, day, qty) of the occupied days
+        """
+        if not product_ids:
+            return []
+        self.env.cr.execute(
+            """
+            SELECT product_id, day, SUM(reserved_qty + confirmed_qty)::float8
+            FROM rental_occupancy_day
+            WHERE product_id IN %s AND day BETWEEN %s AND %s
+            GROUP BY product_id, day
+            """,
+            (tuple(product_ids), start_date, end_date),
+        )
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _get_max_occupied_qty_multi(self, values, confirmed_only=False):
+        """Return the peak quantities of several periods with one query.
+
+        :param values: list of tuples (key, product_id, start_date, end_date,
+            own_qty), own_qty being occupied by the checked line itself
+            during the whole period
+        :param confirmed_only: only count the quantities of confirmed orders
+        :return: dict mapping each key to its peak quantity
+        """
+        if not values:
+            return {}
+        keys, product_ids, start_dates, end_dates, own_qties = [
+            list(column) for column in zip(*values)
+        ]
+        self.env.cr.execute(
+            """
+            SELECT p.key, COALESCE(MAX(occupancy.qty), 0)
+            FROM unnest(
+                %s::integer[], %s::integer[], %s::date[], %s::date[],
+                %s::numeric[]
+            ) AS p(key, product_id, start_date, end_date, own_qty)
+            LEFT JOIN LATERAL (
+                SELECT SUM(
+                    o.confirmed_qty + CASE WHEN %s THEN 0 ELSE o.reserved_qty END
+                ) - p.own_qty AS qty
+                FROM rental_occupancy_day o
+                WHERE o.product_id = p.product_id
+                    AND o.day BETWEEN p.start_date AND p.end_date
+                GROUP BY o.day
+            ) AS occupancy ON TRUE
+            GROUP BY p.key
+            """,
+            (keys, product_ids, start_dates, end_dates, own_qties, confirmed_only),
+        )
+        return {key: float(qty) for key, qty in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_max_occupied_qty_per_warehouse(self, values):
+        """Return the peak quantities of several periods per warehouse with
+        one query.
+
+        :param values: list of tuples (key, product_id, start_date, end_date,
+            own_warehouse_id, own_qty), own_qty being occupied by the checked
+            line itself in own_warehouse_id during the whole period
+        :return: dict mapping each key to a dict mapping the ids of the
+            warehouses renting out the product in the period to their peak
+            quantity
+        """
+        res = defaultdict(dict)
+        if not values:
+            return res
+        keys, product_ids, start_dates, end_dates, warehouse_ids, own_qties = [
+            list(column) for column in zip(*values)
+        ]
+        self.env.cr.execute(
+            """
+            SELECT p.key, occupancy.warehouse_id, MAX(occupancy.qty)
+            FROM unnest(
+                %s::integer[], %s::integer[], %s::date[], %s::date[],
+                %s::integer[], %s::numeric[]
+            ) AS p(key, product_id, start_date, end_date, warehouse_id, own_qty)
+            JOIN LATERAL (
+                SELECT o.warehouse_id,
+                    SUM(o.reserved_qty + o.confirmed_qty) - CASE
+                        WHEN o.warehouse_id = p.warehouse_id THEN p.own_qty ELSE 0
+                    END AS qty
+                FROM rental_occupancy_day o
+                WHERE o.product_id = p.product_id
+                    AND o.day BETWEEN p.start_date AND p.end_date
+                GROUP BY o.warehouse_id, o.day
+            ) AS occupancy ON TRUE
+            GROUP BY p.key, occupancy.warehouse_id
+            """,
+            (keys, product_ids, start_dates, end_dates, warehouse_ids, own_qties),
+        )
+        for key, warehouse_id, qty in self.env.cr.fetchall():
+            res[key][warehouse_id] = float(qty)
+        return res
+
+    @api.model
+    def _lock_products(self, product_ids):
+        """Wait for the transactions checking the availability of the given
+        products to finish, until the end of the current transaction.
+
+        The advisory locks are taken in the order of the product ids, so
+        that two transactions locking the same products cannot deadlock.
+        The occupancy versions of the products are then bumped, so that the
+        transaction fails with a serialization error if another one renting
+        the products committed in the meantime, even in another warehouse.
+        """
+        for product_id in sorted(set(product_ids)):
+            self.env.cr.execute(
+                "SELECT pg_advisory_xact_lock(%s, %s)",
+                (RENTAL_PRODUCT_LOCK, product_id),
+            )
+        self.env["rental.occupancy.version"]._bump_versions(product_ids)
+
+    @api.model
+    def _rebuild_occupancy(self):
+        """Fill the ledger from scratch with all rental order lines."""
+        self.env.cr.execute("DELETE FROM rental_occupancy_day")
+        lines = self.env["sale.order.line"].search(
+            [
+                ("state", "!=", "cancel"),
+                ("display_product_id", "!=", False),
+                ("start_date", "!=", False),
+                ("end_date", "!=", False),
+                ("rental_qty", ">", 0),
+            ]
+        )
+        self._add_occupancy(lines._get_rental_occupancy_values())
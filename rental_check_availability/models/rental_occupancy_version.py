@@ -0,0 +1,53 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models
+
+
+class RentalOccupancyVersion(models.Model):
+    _name = "rental.occupancy.version"
+    _description = "Occupancy Version of Rented Products"
+    _log_access = False
+
+    product_id = fields.Many2one(
+        comodel_name="product.product",
+        string="Rented Product",
+        required=True,
+        ondelete="cascade",
+    )
+
+    version = fields.Integer(
+        string="Version",
+        help="Bumped whenever an order renting the product is confirmed "
+        "with the strict availability check.",
+    )
+
+    _sql_constraints = [
+        (
+            "product_uniq",
+            "UNIQUE(product_id)",
+            "There can only be one occupancy version per product.",
+        ),
+    ]
+
+    @api.model
+    def _bump_versions(self, product_ids):
+        """Write the version row of the given products.
+
+        Two transactions bumping the version of the same product conflict,
+        whatever the warehouses and days they add to the ledger: the last
+        one fails with a serialization error once the first one committed.
+        """
+        product_ids = sorted({product_id for product_id in product_ids if product_id})
+        if not product_ids:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO rental_occupancy_version (product_id, version)
+            SELECT product_id, 1
+            FROM unnest(%s::integer[]) AS product_id
+            ON CONFLICT (product_id) DO UPDATE
+                SET version = rental_occupancy_version.version + 1
+            """,
+            (product_ids,),
+        )
+        self.invalidate_cache(fnames=["version"])
@@ -0,0 +1,14 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import fields, models
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    rental_strict_availability = fields.Boolean(
+        string="Strict Rental Availability",
+        help="Refuse to confirm rental orders which rent out more units of a "
+        "product than available in the rental location, taking into account "
+        "the orders confirmed at the same time by other users.",
+    )
@@ -1,5 +1,17 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+import logging
+from collections import defaultdict
+
+import psycopg2
+from dateutil.relativedelta import relativedelta
+
 from odoo import _, api, exceptions, fields, models
+from odoo.osv import expression
+from odoo.tools import float_compare, sql
+from odoo.tools.misc import format_date
+
+_logger = logging.getLogger(__name__)
 
 
 class SaleOrder(models.Model):
@@ -7,14 +19,100 @@ class SaleOrder(models.Model):
 
     @api.multi
     def action_check_rental_availability(self):
-        for order in self:
-            for line in order.order_line:
-                line._check_rental_availability()
+        self.mapped("order_line")._check_rental_availability_multi()
+
+    @api.multi
+    def write(self, vals):
+        if "warehouse_id" not in vals:
+            return super().write(vals)
+        lines = self.mapped("order_line")
+        lines._add_rental_occupancy(sign=-1)
+        res = super().write(vals)
+        lines.exists()._add_rental_occupancy()
+        return res
+
+    @api.multi
+    def action_confirm(self):
+        lines = self.mapped("order_line")
+        strict_lines = self.filtered(
+            lambda o: o.company_id.rental_strict_availability
+        ).mapped("order_line")
+        self.env["rental.occupancy.day"]._lock_products(
+            strict_lines.mapped("display_product_id").ids
+        )
+        lines._add_rental_occupancy(sign=-1)
+        res = super().action_confirm()
+        lines._add_rental_occupancy()
+        strict_lines._check_rental_availability_strict()
+        return res
+
+    @api.multi
+    def action_cancel(self):
+        lines = self.mapped("order_line")
+        lines._add_rental_occupancy(sign=-1)
+        res = super().action_cancel()
+        lines._add_rental_occupancy()
+        return res
+
+    @api.multi
+    def action_draft(self):
+        lines = self.mapped("order_line")
+        lines._add_rental_occupancy(sign=-1)
+        res = super().action_draft()
+        lines._add_rental_occupancy()
+        return res
+
+    @api.multi
+    def unlink(self):
+        # the lines are deleted by the database without calling their unlink
+        self.mapped("order_line")._add_rental_occupancy(sign=-1)
+        return super().unlink()
 
 
 class SaleOrderLine(models.Model):
     _inherit = "sale.order.line"
 
+    @api.model_cr
+    def init(self):
+        super().init()
+        self._create_rental_period_index()
+
+    @api.model_cr
+    def _create_rental_period_index(self):
+        """Create the GiST index used to find overlapping rental periods.
+
+        The product is part of the index when the btree_gist extension is
+        available, otherwise only the rental period is indexed.
+        """
+        cr = self._cr
+        if sql.index_exists(cr, "sale_order_line_rental_period_index"):
+            return
+        cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'btree_gist'")
+        has_btree_gist = bool(cr.fetchone())
+        if not has_btree_gist:
+            try:
+                with cr.savepoint():
+                    cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+                has_btree_gist = True
+            except psycopg2.Error:
+                _logger.warning(
+                    "The PostgreSQL extension btree_gist could not be installed, "
+                    "the rental periods of order lines are indexed without "
+                    "their product."
+                )
+        columns = "daterange(start_date, end_date, '[]')"
+        if has_btree_gist:
+            columns = "display_product_id, " + columns
+        cr.execute(  # pylint: disable=sql-injection
+            """
+            CREATE INDEX sale_order_line_rental_period_index
+            ON sale_order_line USING gist ({columns})
+            WHERE start_date <= end_date
+            """.format(
+                columns=columns
+            )
+        )
+
     concurrent_orders = fields.Selection(
         selection=[
             ("none", "None"),
@@ -22,6 +120,7 @@ class SaleOrderLine(models.Model):
             ("order", "Order"),
         ],
         default="none",
+        index=True,
     )
 
     # (override) _check_rental_availability in module rental_pricelist
@@ -31,36 +130,312 @@ class SaleOrderLine(models.Model):
         res = {}
         if not self.start_date or not self.end_date or not self.rental_qty:
             return {}
-        total_qty = self.product_id.rented_product_id.with_context(
-            {"location": self.order_id.warehouse_id.rental_view_location_id.id}
-        ).qty_available
-        max_ol_qty = self._get_max_overlapping_rental_qty()
+        rented_product = self.product_id.rented_product_id
+        total_qty = rented_product._get_rental_location_qties(
+            self.order_id.warehouse_id.rental_view_location_id.id
+        )[rented_product.id]["qty_available"]
+        max_ol_qty = self._get_max_occupied_rental_qty()
         avail_qty = total_qty - max_ol_qty
         if self.rental_qty > avail_qty:
             res = self._get_concurrent_orders()
-            if total_qty == 0:
-                self.concurrent_orders = "none"
-            elif res["quotation"] and not res["order"]:
-                self.concurrent_orders = "quotation"
-            else:
-                self.concurrent_orders = "order"
+            self.concurrent_orders = self._get_concurrent_orders_state(
+                total_qty, res["quotation"], res["order"]
+            )
+            message = _(
+                "You want to rent %.2f %s but you only "
+                "have %.2f %s available in the selected period."
+            ) % (
+                self.rental_qty,
+                self.product_id.rented_product_id.uom_id.name,
+                avail_qty,
+                self.product_id.rented_product_id.uom_id.name,
+            )
+            res["suggestion"] = self._get_rental_suggestion(total_qty)
+            if res["suggestion"]["start_date"]:
+                message += "\n" + _(
+                    "The requested quantity is available for the same "
+                    "duration from %s on."
+                ) % format_date(self.env, res["suggestion"]["start_date"])
+            if res["suggestion"]["products"]:
+                message += "\n" + _(
+                    "Alternative products available in the selected period: %s"
+                ) % ", ".join(res["suggestion"]["products"].mapped("display_name"))
+            free_qtys = self._get_rental_warehouse_free_qtys()[self.id]
+            res["warehouses"] = self.env["stock.warehouse"].browse(
+                [
+                    warehouse_id
+                    for warehouse_id, free_qty in free_qtys.items()
+                    if warehouse_id != self.order_id.warehouse_id.id
+                    and free_qty >= self.rental_qty
+                ]
+            )
+            if res["warehouses"]:
+                message += "\n" + _(
+                    "Warehouses with the requested quantity available: %s"
+                ) % ", ".join(
+                    "%s (%.2f)" % (warehouse.name, free_qtys[warehouse.id])
+                    for warehouse in res["warehouses"]
+                )
             res["warning"] = {
                 "title": _("Not enough stock!"),
-                "message": _(
-                    "You want to rent %.2f %s but you only "
-                    "have %.2f %s available in the selected period."
-                )
-                % (
-                    self.rental_qty,
-                    self.product_id.rented_product_id.uom_id.name,
-                    avail_qty,
-                    self.product_id.rented_product_id.uom_id.name,
-                ),
+                "message": message,
             }
         else:
             self.concurrent_orders = "none"
         return res
 
+    @api.model
+    def _get_concurrent_orders_state(self, total_qty, quotations, orders):
+        if total_qty == 0:
+            return "none"
+        elif quotations and not orders:
+            return "quotation"
+        return "order"
+
+    @api.multi
+    def _check_rental_availability_multi(self):
+        """Set-based variant of _check_rental_availability for stored lines.
+
+        The stock is computed once per rental location, the peak occupancies
+        of all lines come from one query on the occupancy ledger and the
+        concurrent orders of the lines not available from one search.
+
+        :return: recordset of the lines without enough stock
+        """
+        lines = self.filtered(
+            lambda l: l.start_date
+            and l.end_date
+            and l.rental_qty
+            and l.display_product_id
+        )
+        total_qtys = lines._get_rental_stock_qty_multi()
+        occupied_qtys = lines._get_max_occupied_rental_qty_multi()
+        short_lines = lines.filtered(
+            lambda l: l.rental_qty > total_qtys[l.id] - occupied_qtys[l.id]
+        )
+        concurrent_lines = short_lines._get_concurrent_order_lines_multi()
+        states = defaultdict(lambda: self.browse())
+        for line in lines - short_lines:
+            states["none"] |= line
+        for line in short_lines:
+            orders = concurrent_lines[line.id].mapped("order_id")
+            state = self._get_concurrent_orders_state(
+                total_qtys[line.id],
+                orders.filtered(lambda o: o.state in ["draft", "sent"]),
+                orders.filtered(lambda o: o.state in ["sale"]),
+            )
+            states[state] |= line
+        for state, state_lines in states.items():
+            state_lines.filtered(lambda l: l.concurrent_orders != state).write(
+                {"concurrent_orders": state}
+            )
+        return short_lines
+
+    @api.multi
+    def _check_rental_availability_strict(self):
+        """Raise if the confirmed orders rent out more than the stock of a
+        product on a day of the periods of the lines.
+
+        Called on confirmation while holding the locks of the rented
+        products, after the lines were added to the ledger. A confirmation
+        committed by another transaction in the meantime bumped the same
+        occupancy versions, so the confirmation fails with a serialization
+        error and is retried with fresh data.
+        """
+        lines = self.filtered(
+            lambda l: l.start_date
+            and l.end_date
+            and l.rental_qty
+            and l.display_product_id
+            and l.state != "cancel"
+        )
+        total_qtys = lines._get_rental_stock_qty_multi()
+        occupied_qtys = lines._get_max_occupied_rental_qty_multi(confirmed_only=True)
+        short_lines = lines.filtered(
+            lambda l: float_compare(
+                l.rental_qty,
+                total_qtys[l.id] - occupied_qtys[l.id],
+                precision_rounding=l.display_product_id.uom_id.rounding,
+            )
+            > 0
+        )
+        if short_lines:
+            raise exceptions.UserError(
+                _("Not enough stock to confirm the rental of:\n%s")
+                % "\n".join(
+                    _("%s from %s to %s (%.2f available)")
+                    % (
+                        line.display_product_id.display_name,
+                        format_date(self.env, line.start_date),
+                        format_date(self.env, line.end_date),
+                        total_qtys[line.id] - occupied_qtys[line.id],
+                    )
+                    for line in short_lines
+                )
+            )
+
+    @api.model
+    def _cron_update_concurrent_orders(self):
+        """Update the stored concurrent orders of the lines renting the
+        products whose occupancy changed since the last run, on the days
+        which changed and did not pass yet.
+        """
+        changes = self.env["rental.occupancy.change"]._pop_changes()
+        if not changes:
+            return
+        self.search(
+            [
+                ("display_product_id", "in", list(changes)),
+                ("state", "=", "cancel"),
+                ("concurrent_orders", "!=", "none"),
+            ]
+        ).write({"concurrent_orders": "none"})
+        domain = expression.OR(
+            [
+                [
+                    ("display_product_id", "=", product_id),
+                    ("start_date", "<=", end_date),
+                    ("end_date", ">=", start_date),
+                ]
+                for product_id, (start_date, end_date) in changes.items()
+            ]
+        )
+        self.search(
+            domain
+            + [
+                ("state", "!=", "cancel"),
+                ("end_date", ">=", fields.Date.context_today(self)),
+                ("rental_qty", ">", 0),
+            ]
+        )._check_rental_availability_multi()
+
+    @api.multi
+    def _get_rental_stock_qty_multi(self):
+        """Return the quantity on hand of the rented products per line id,
+        computed with one call per rental location.
+        """
+        res = {}
+        lines_by_location = defaultdict(lambda: self.browse())
+        for line in self:
+            location = line.order_id.warehouse_id.rental_view_location_id
+            lines_by_location[location] |= line
+        for location, lines in lines_by_location.items():
+            products = lines.mapped("product_id.rented_product_id")
+            qties = products._get_rental_location_qties(location.id)
+            for line in lines:
+                product = line.product_id.rented_product_id
+                res[line.id] = qties.get(product.id, {}).get("qty_available", 0.0)
+        return res
+
+    @api.multi
+    def _get_rental_warehouse_free_qtys(self):
+        """Return the free quantity of the rented products in the period of
+        the lines for every warehouse of their company renting out products.
+
+        The stock comes from one grouped quant query and the occupancy from
+        one grouped query on the ledger, whatever the number of warehouses.
+
+        :return: dict mapping line ids to dicts mapping warehouse ids to the
+            free quantity
+        """
+        res = {line.id: {} for line in self}
+        lines = self.filtered(
+            lambda l: l.start_date
+            and l.end_date
+            and l.display_product_id
+            and l.order_id.company_id
+        )
+        if not lines:
+            return res
+        warehouses = self.env["stock.warehouse"].search(
+            [
+                ("company_id", "in", lines.mapped("order_id.company_id").ids),
+                ("rental_view_location_id", "!=", False),
+            ]
+        )
+        products = lines.mapped("display_product_id")
+        stock_qties = products._get_rental_warehouse_stock_qties(warehouses)
+        values = []
+        for index, line in enumerate(lines):
+            own_values = line._get_rental_own_occupancy_values()
+            values.append(
+                (
+                    index,
+                    line.display_product_id.id,
+                    line.start_date,
+                    line.end_date,
+                    own_values and own_values[1] or 0,
+                    own_values and own_values[4] + own_values[5] or 0.0,
+                )
+            )
+        occupied_qties = self.env[
+            "rental.occupancy.day"
+        ]._get_max_occupied_qty_per_warehouse(values)
+        for index, line in enumerate(lines):
+            product_id = line.display_product_id.id
+            res[line.id] = {
+                warehouse.id: stock_qties.get((product_id, warehouse.id), 0.0)
+                - occupied_qties[index].get(warehouse.id, 0.0)
+                for warehouse in warehouses
+                if warehouse.company_id == line.order_id.company_id
+            }
+        return res
+
+    @api.multi
+    def _get_max_occupied_rental_qty_multi(self, confirmed_only=False):
+        """Return the peak quantity occupied by other lines per line id.
+
+        :param confirmed_only: only count the lines of confirmed orders
+        """
+        values = []
+        for line in self:
+            own_qty = sum(
+                v[5] if confirmed_only else v[4] + v[5]
+                for v in line._get_rental_occupancy_values()
+                if v[0] == line.display_product_id.id
+            )
+            values.append(
+                (
+                    line.id,
+                    line.display_product_id.id,
+                    line.start_date,
+                    line.end_date,
+                    own_qty,
+                )
+            )
+        return self.env["rental.occupancy.day"]._get_max_occupied_qty_multi(
+            values, confirmed_only=confirmed_only
+        )
+
+    @api.multi
+    def _get_concurrent_order_lines_multi(self):
+        """Return the concurrent order lines per line id with one search."""
+        if not self:
+            return {}
+        candidates = self.search(
+            [
+                ("state", "!=", "cancel"),
+                ("display_product_id", "in", self.mapped("display_product_id").ids),
+                ("start_date", "<=", max(self.mapped("end_date"))),
+                ("end_date", ">=", min(self.mapped("start_date"))),
+            ]
+        )
+        candidates_by_product = defaultdict(list)
+        for candidate in candidates:
+            candidates_by_product[candidate.display_product_id.id].append(candidate)
+        res = {}
+        for line in self:
+            res[line.id] = self.browse(
+                [
+                    candidate.id
+                    for candidate in candidates_by_product[line.display_product_id.id]
+                    if candidate.id != line.id
+                    and candidate.start_date <= line.end_date
+                    and candidate.end_date >= line.start_date
+                ]
+            )
+        return res
+
     @api.onchange("start_date", "end_date", "product_uom")
     def onchange_start_end_date(self):
         res = {}
@@ -73,22 +448,45 @@ class SaleOrderLine(models.Model):
     @api.multi
     def _get_concurrent_order_lines(self):
         self.ensure_one()
-        domain = []
-        if self.id:
-            domain = [("id", "!=", self.id)]
-        domain += [
+        return self._search_overlapping_rental_lines(
+            self.display_product_id.id,
+            self.start_date,
+            self.end_date,
+            exclude_ids=self._get_rental_origin().ids,
+        )
+
+    @api.model
+    def _search_overlapping_rental_lines(
+        self, product_id, start_date, end_date, exclude_ids=None
+    ):
+        """Return the rental lines of a product overlapping the given period.
+
+        The overlap is tested with the daterange operator && so that the
+        GiST index created in init() is used.
+        """
+        domain = [
             ("state", "!=", "cancel"),
-            ("display_product_id", "=", self.display_product_id.id),
-            "|",
-            "&",
-            ("start_date", "<=", self.start_date),
-            ("end_date", ">=", self.start_date),
-            "&",
-            ("start_date", "<=", self.end_date),
-            ("end_date", ">=", self.end_date),
+            ("display_product_id", "=", product_id),
         ]
-        res = self.search(domain)
-        return res
+        if exclude_ids:
+            domain.append(("id", "not in", exclude_ids))
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        self.env.cr.execute(  # pylint: disable=sql-injection
+            """
+            SELECT "sale_order_line".id FROM {from_clause}
+            WHERE {where_clause}
+                AND "sale_order_line".start_date <= "sale_order_line".end_date
+                AND daterange(
+                    "sale_order_line".start_date, "sale_order_line".end_date, '[]'
+                ) && daterange(%s, %s, '[]')
+            """.format(
+                from_clause=from_clause, where_clause=where_clause
+            ),
+            where_params + [start_date, end_date],
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
 
     @api.multi
     def _get_concurrent_orders(self):
@@ -114,29 +512,154 @@ class SaleOrderLine(models.Model):
         raise exceptions.UserError(_("No found concurrent Rental Order/Quotation(s)."))
 
     @api.multi
-    def _get_max_overlapping_rental_qty(self):
+    def _get_rental_origin(self):
+        """Return the stored line of a line being edited in an onchange."""
         self.ensure_one()
-        lines = self._get_concurrent_order_lines()
-        max_qty = 0
-        for line in lines:
-            ol_lines = self.search(
-                [
-                    ("id", "in", lines.ids),
-                    ("start_date", "<=", line.start_date),
-                    ("end_date", ">=", line.start_date),
-                ]
-            )
-            tmp_qty = sum(l.rental_qty for l in ol_lines)
-            if tmp_qty > max_qty:
-                max_qty = tmp_qty
-            ol_lines = self.search(
-                [
-                    ("id", "in", lines.ids),
-                    ("start_date", "<=", line.end_date),
-                    ("end_date", ">=", line.end_date),
-                ]
+        if isinstance(self.id, models.NewId):
+            return getattr(self, "_origin", None) or self.browse()
+        return self
+
+    @api.model
+    def _get_rental_occupancy_fields(self):
+        """Return the fields changing the occupancy of a rental line."""
+        return {
+            "display_product_id",
+            "start_date",
+            "end_date",
+            "rental_qty",
+            "order_id",
+        }
+
+    @api.multi
+    def _get_rental_occupancy_values(self):
+        """Return the contributions of the lines to the occupancy ledger.
+
+        :return: list of tuples (product_id, warehouse_id, start_date,
+            end_date, reserved_qty, confirmed_qty)
+        """
+        values = []
+        for line in self:
+            order = line.order_id
+            if (
+                order.state == "cancel"
+                or not order.warehouse_id
+                or not line.display_product_id
+                or not line.start_date
+                or not line.end_date
+                or not line.rental_qty
+            ):
+                continue
+            confirmed = order.state in ("sale", "done")
+            values.append(
+                (
+                    line.display_product_id.id,
+                    order.warehouse_id.id,
+                    line.start_date,
+                    line.end_date,
+                    0.0 if confirmed else line.rental_qty,
+                    line.rental_qty if confirmed else 0.0,
+                )
             )
-            tmp_qty = sum(l.rental_qty for l in ol_lines)
-            if tmp_qty > max_qty:
-                max_qty = tmp_qty
-        return max_qty
+        return values
+
+    @api.multi
+    def _add_rental_occupancy(self, sign=1):
+        self.env["rental.occupancy.day"]._add_occupancy(
+            self._get_rental_occupancy_values(), sign=sign
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._add_rental_occupancy()
+        return lines
+
+    @api.multi
+    def write(self, vals):
+        if not self._get_rental_occupancy_fields().intersection(vals):
+            return super().write(vals)
+        self._add_rental_occupancy(sign=-1)
+        res = super().write(vals)
+        self._add_rental_occupancy()
+        return res
+
+    @api.multi
+    def unlink(self):
+        self._add_rental_occupancy(sign=-1)
+        return super().unlink()
+
+    @api.multi
+    def _get_max_occupied_rental_qty(self):
+        """Return the peak quantity of the rented product occupied by other
+        lines in the period of this line, read from the occupancy ledger.
+        """
+        self.ensure_one()
+        return self.env["rental.occupancy.day"]._get_max_occupied_qty(
+            self.display_product_id.id,
+            self.start_date,
+            self.end_date,
+            self._get_rental_own_occupancy_values(),
+        )
+
+    @api.multi
+    def _get_rental_own_occupancy_values(self):
+        """Return the occupancy tuple of the stored line for the product of
+        this line, or False if the line does not occupy it yet.
+        """
+        self.ensure_one()
+        own_values = False
+        for values in self._get_rental_origin()._get_rental_occupancy_values():
+            if values[0] == self.display_product_id.id:
+                own_values = values
+        return own_values
+
+    @api.multi
+    def _get_rental_suggestion(self, total_qty, horizon=365):
+        """Propose alternatives to a line without enough stock.
+
+        :param total_qty: quantity of the rented product in stock
+        :param horizon: number of days searched for a free period
+        :return: dict with the earliest start date from the start date of
+            the line on at which the rental quantity is available for the
+            same duration (False if none in the horizon), and the rentable
+            products of the same category available in the period
+        """
+        self.ensure_one()
+        duration = (self.end_date - self.start_date).days + 1
+        occupied_qties = self.env["rental.occupancy.day"]._get_daily_occupied_qties(
+            self.display_product_id.id,
+            self.start_date,
+            self.start_date + relativedelta(days=horizon + duration - 2),
+            self._get_rental_own_occupancy_values(),
+        )
+        start_date = False
+        free_days = 0
+        for day, occupied_qty in enumerate(occupied_qties):
+            if self.rental_qty + occupied_qty > total_qty:
+                free_days = 0
+                continue
+            free_days += 1
+            if free_days == duration:
+                start_date = self.start_date + relativedelta(days=day - duration + 1)
+                break
+        ProductObj = self.env["product.product"]
+        products = ProductObj.search(
+            [
+                ("rental", "=", True),
+                ("type", "=", "product"),
+                ("categ_id", "=", self.display_product_id.categ_id.id),
+                ("id", "!=", self.display_product_id.id),
+            ]
+        )
+        free_qties = ProductObj._get_rental_free_qties(
+            self.start_date,
+            self.end_date,
+            self.order_id.warehouse_id.id,
+            products.ids,
+        )
+        return {
+            "start_date": start_date,
+            "products": products.filtered(
+                lambda p: free_qties[p.id] >= self.rental_qty
+            ),
+        }
@@ -1,3 +1,4 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 
 from . import test_check_availability
+from . import test_benchmark
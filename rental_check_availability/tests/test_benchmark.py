@@ -0,0 +1,277 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+"""Benchmark of the rental availability checks on synthetic data.
+
+The benchmark is excluded from the standard test run. Run it on a local
+database with::
+
+    odoo -d rental_benchmark -i rental_check_availability \
+        --test-tags rental_benchmark --stop-after-init --log-level=test
+
+The data volume is configured with the environment variables
+RENTAL_BENCHMARK_PRODUCTS, RENTAL_BENCHMARK_LINES, RENTAL_BENCHMARK_HORIZON,
+RENTAL_BENCHMARK_DURATION, RENTAL_BENCHMARK_SAMPLE and RENTAL_BENCHMARK_SEED.
+Everything is rolled back at the end of the run.
+"""
+
+import logging
+import os
+import random
+import time
+
+from odoo import fields
+from odoo.tests import tagged
+
+from odoo.addons.rental_base.tests.stock_common import RentalStockCommon
+
+_logger = logging.getLogger(__name__)
+
+
+def _get_param(name, default):
+    return int(os.environ.get("RENTAL_BENCHMARK_%s" % name, default))
+
+
+@tagged("post_install", "-at_install", "-standard", "rental_benchmark")
+class BenchmarkRentalCheckAvailability(RentalStockCommon):
+    def setUp(self):
+        super().setUp()
+        self.product_count = _get_param("PRODUCTS", 1000)
+        self.line_count = _get_param("LINES", 50000)
+        # days over which the start dates are spread
+        self.horizon = _get_param("HORIZON", 365)
+        # mean duration in days of the rentals, exponentially distributed
+        self.duration = _get_param("DURATION", 7)
+        # number of calls measured per method
+        self.sample = _get_param("SAMPLE", 100)
+        self.seed = _get_param("SEED", 42)
+        self.today = fields.Date.from_string(fields.Date.today())
+        self.results = []
+
+    def _create_products(self):
+        rng = random.Random(self.seed)
+        ProductObj = self.env["product.product"]
+        products = ProductObj.browse()
+        for index in range(self.product_count):
+            products |= ProductObj.create(
+                {
+                    "name": "Benchmark Product %s" % index,
+                    "type": "product",
+                    "rental": True,
+                    "rental_of_day": True,
+                    "rental_price_day": 100,
+                }
+            )
+        for product in products:
+            self.env["stock.quant"]._update_available_quantity(
+                product, self.warehouse0.rental_in_location_id, rng.randint(1, 10)
+            )
+        return products
+
+    def _get_copy_columns(self, table, exclude):
+        self.env.cr.execute(
+            """
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = %s AND column_name != 'id'
+            """,
+            (table,),
+        )
+        return [
+            '"%s"' % column
+            for column, in self.env.cr.fetchall()
+            if column not in exclude
+        ]
+
+    def _create_template_line(self, product):
+        order = (
+            self.env["sale.order"]
+            .with_context(default_type_id=self.rental_sale_type.id)
+            .create(
+                {
+                    "warehouse_id": self.warehouse0.id,
+                    "partner_id": self.partnerA.id,
+                    "pricelist_id": self.env.ref("product.list0").id,
+                }
+            )
+        )
+        return self.env["sale.order.line"].create(
+            {
+                "order_id": order.id,
+                "product_id": product.product_rental_day_id.id,
+                "display_product_id": product.id,
+                "rental": True,
+                "rental_type": "new_rental",
+                "rental_qty": 1,
+                "product_uom_qty": 1,
+                "product_uom": self.uom_day.id,
+                "start_date": self.today,
+                "end_date": self.today,
+            }
+        )
+
+    def _create_rental_lines(self, products):
+        """Copy a template order and line with one query each.
+
+        The start dates are uniformly spread over the horizon, the durations
+        are exponentially distributed around the mean duration and every
+        order has five lines, two orders out of three being confirmed.
+        """
+        template = self._create_template_line(products[0])
+        cr = self.env.cr
+        cr.execute("SELECT setseed(%s)", (1.0 / (1 + self.seed),))
+        order_columns = self._get_copy_columns("sale_order", {"name", "state"})
+        # pylint: disable=sql-injection
+        cr.execute(
+            """
+            INSERT INTO sale_order (name, state, {columns})
+            SELECT 'BENCH/' || n,
+                CASE WHEN n %% 3 = 0 THEN 'draft' ELSE 'sale' END,
+                {columns}
+            FROM sale_order, generate_series(1, %s) AS n
+            WHERE sale_order.id = %s
+            RETURNING id
+            """.format(
+                columns=", ".join(order_columns)
+            ),
+            (max(self.line_count // 5, 1), template.order_id.id),
+        )
+        order_ids = [order_id for order_id, in cr.fetchall()]
+        line_columns = self._get_copy_columns(
+            "sale_order_line",
+            {
+                "order_id",
+                "display_product_id",
+                "product_id",
+                "start_date",
+                "end_date",
+                "rental_qty",
+                "product_uom_qty",
+                "state",
+            },
+        )
+        # pylint: disable=sql-injection
+        cr.execute(
+            """
+            WITH params AS (
+                SELECT n,
+                    1 + floor(random() * %(products)s)::integer AS p,
+                    floor(random() * %(horizon)s)::integer AS start_offset,
+                    1 + floor(-ln(1 - random()) * %(duration)s)::integer AS days,
+                    1 + floor(random() * 3)::integer AS qty
+                FROM generate_series(0, %(lines)s - 1) AS n
+            )
+            INSERT INTO sale_order_line (
+                order_id, display_product_id, product_id, start_date, end_date,
+                rental_qty, product_uom_qty, state, {columns}
+            )
+            SELECT (%(order_ids)s::integer[])[1 + params.n %% %(orders)s],
+                (%(product_ids)s::integer[])[params.p],
+                (%(service_ids)s::integer[])[params.p],
+                %(today)s::date + params.start_offset,
+                %(today)s::date + params.start_offset + params.days - 1,
+                params.qty,
+                params.qty * params.days,
+                'draft',
+                {columns}
+            FROM sale_order_line, params
+            WHERE sale_order_line.id = %(template)s
+            """.format(
+                columns=", ".join(line_columns)
+            ),
+            {
+                "products": len(products),
+                "horizon": self.horizon,
+                "duration": self.duration,
+                "lines": self.line_count,
+                "order_ids": order_ids,
+                "orders": len(order_ids),
+                "product_ids": products.ids,
+                "service_ids": [p.product_rental_day_id.id for p in products],
+                "today": self.today,
+                "template": template.id,
+            },
+        )
+        cr.execute(
+            """
+            UPDATE sale_order_line l SET state = o.state
+            FROM sale_order o
+            WHERE o.id = l.order_id AND o.id IN %s
+            """,
+            (tuple(order_ids),),
+        )
+        self.env["rental.occupancy.day"]._rebuild_occupancy()
+        self.env["sale.order.line"].invalidate_cache()
+        return self.env["sale.order"].browse(order_ids)
+
+    def _measure(self, name, records, method):
+        """Call method on each record with a cold cache and keep the wall
+        time and the number of queries of every call.
+        """
+        timings = []
+        query_counts = []
+        for record in records:
+            record.invalidate_cache()
+            query_count = self.env.cr.sql_log_count
+            start = time.perf_counter()
+            method(record)
+            timings.append(time.perf_counter() - start)
+            query_counts.append(self.env.cr.sql_log_count - query_count)
+        self.results.append((name, timings, query_counts))
+
+    def _report(self):
+        lines = [
+            "%-40s %6s %10s %10s %10s %8s"
+            % ("method", "calls", "total (s)", "mean (ms)", "max (ms)", "queries")
+        ]
+        for name, timings, query_counts in self.results:
+            calls = len(timings) or 1
+            lines.append(
+                "%-40s %6d %10.3f %10.2f %10.2f %8.1f"
+                % (
+                    name,
+                    len(timings),
+                    sum(timings),
+                    sum(timings) / calls * 1000,
+                    max(timings or [0]) * 1000,
+                    sum(query_counts) / calls,
+                )
+            )
+        _logger.info(
+            "Rental availability benchmark: %s products, %s lines, "
+            "horizon %s days, mean duration %s days\n%s",
+            self.product_count,
+            self.line_count,
+            self.horizon,
+            self.duration,
+            "\n".join(lines),
+        )
+
+    def test_benchmark(self):
+        start = time.perf_counter()
+        products = self._create_products()
+        orders = self._create_rental_lines(products)
+        _logger.info(
+            "Rental availability benchmark: data generated in %.1fs",
+            time.perf_counter() - start,
+        )
+        rng = random.Random(self.seed)
+        sample_orders = orders.browse(
+            rng.sample(orders.ids, min(self.sample, len(orders)))
+        )
+        sample_lines = sample_orders.mapped("order_line")[: self.sample]
+        self._measure(
+            "sale.order.line _check_rental_availability",
+            sample_lines,
+            lambda line: line._check_rental_availability(),
+        )
+        self._measure(
+            "sale.order.line _get_concurrent_orders",
+            sample_lines,
+            lambda line: line._get_concurrent_orders(),
+        )
+        self._measure(
+            "sale.order action_check_rental_availability",
+            sample_orders,
+            lambda order: order.action_check_rental_availability(),
+        )
+        self._report()
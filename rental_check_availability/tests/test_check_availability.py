@@ -2,7 +2,8 @@
 
 from dateutil.relativedelta import relativedelta
 
-from odoo import fields
+from odoo import exceptions, fields
+from odoo.tools.misc import format_date
 
 from odoo.addons.rental_base.tests.stock_common import RentalStockCommon
 from odoo.addons.rental_pricelist.tests.test_rental_pricelist import (
@@ -85,12 +86,9 @@ class TestRentalCheckAvailability(RentalStockCommon):
         # RO 6  (qty: 1)              5 --------- 15 (none)
         msg = (
             "You want to rent 3.00 Unit(s) but you only have 2.00 Unit(s) "
-            "available in the selected period."
+            "available in the selected period.\n"
+            "The requested quantity is available for the same duration from %s on."
         )
-        expected_warning = {
-            "title": "Not enough stock!",
-            "message": msg,
-        }
         # create some quantity of productA (qty: 4)
         self.env["stock.quant"]._update_available_quantity(
             self.productA, self.warehouse0.rental_in_location_id, 4
@@ -111,6 +109,10 @@ class TestRentalCheckAvailability(RentalStockCommon):
             self.date_27_day_later, self.date_30_day_later, 3
         )
         res = rental_order_3.order_line.onchange_start_end_date()
+        expected_warning = {
+            "title": "Not enough stock!",
+            "message": msg % format_date(self.env, self.today + relativedelta(days=31)),
+        }
         self.assertEqual(res.get("warning", False), expected_warning)
         self.assertEqual(rental_order_3.order_line.concurrent_orders, "quotation")
         action = rental_order_3.order_line.action_view_concurrent_orders()
@@ -127,6 +129,10 @@ class TestRentalCheckAvailability(RentalStockCommon):
         # RO 5
         rental_order_5 = self.create_rental_order(self.today, self.date_2_day_later, 3)
         res = rental_order_5.order_line.onchange_start_end_date()
+        expected_warning = {
+            "title": "Not enough stock!",
+            "message": msg % format_date(self.env, self.today + relativedelta(days=11)),
+        }
         self.assertEqual(res.get("warning", False), expected_warning)
         self.assertEqual(rental_order_5.order_line.concurrent_orders, "order")
         action = rental_order_5.order_line.action_view_concurrent_orders()
@@ -139,3 +145,313 @@ class TestRentalCheckAvailability(RentalStockCommon):
             self.date_5_day_later, self.date_15_day_later, 1
         )
         self.assertEqual(rental_order_6.order_line.concurrent_orders, "none")
+
+    def test_01_unlink_quotation(self):
+        OccupancyObj = self.env["rental.occupancy.day"]
+        domain = [("product_id", "=", self.productA.id)]
+        quotation = self.create_rental_order(self.today, self.date_2_day_later, 2)
+        other_quotation = self.create_rental_order(
+            self.date_2_day_later, self.date_5_day_later, 1
+        )
+        self.assertEqual(len(OccupancyObj.search(domain)), 6)
+        # the lines of a deleted quotation do not occupy the product anymore
+        quotation.unlink()
+        occupancies = OccupancyObj.search(domain)
+        self.assertEqual(
+            occupancies.mapped("day"),
+            [self.today + relativedelta(days=d) for d in range(2, 6)],
+        )
+        self.assertEqual(occupancies.mapped("reserved_qty"), [1, 1, 1, 1])
+        other_quotation.unlink()
+        self.assertFalse(OccupancyObj.search(domain))
+
+    def test_02_occupancy_ledger(self):
+        OccupancyObj = self.env["rental.occupancy.day"]
+        domain = [("product_id", "=", self.productA.id)]
+        rental_order = self.create_rental_order(self.today, self.date_2_day_later, 2)
+        occupancies = OccupancyObj.search(domain)
+        self.assertEqual(
+            occupancies.mapped("day"),
+            [self.today + relativedelta(days=d) for d in range(3)],
+        )
+        self.assertEqual(occupancies.mapped("reserved_qty"), [2, 2, 2])
+        self.assertEqual(occupancies.mapped("confirmed_qty"), [0, 0, 0])
+        # confirmed orders move the quantity to confirmed
+        rental_order.action_confirm()
+        self.assertEqual(occupancies.mapped("reserved_qty"), [0, 0, 0])
+        self.assertEqual(occupancies.mapped("confirmed_qty"), [2, 2, 2])
+        # changing the period moves the occupancy
+        rental_order.order_line.write(
+            {
+                "start_date": self.date_2_day_later,
+                "end_date": self.date_5_day_later,
+            }
+        )
+        occupancies = OccupancyObj.search(domain + [("confirmed_qty", ">", 0)])
+        self.assertEqual(
+            occupancies.mapped("day"),
+            [self.today + relativedelta(days=d) for d in range(2, 6)],
+        )
+        # cancelled orders do not occupy the product anymore
+        # and the days which are not occupied anymore are deleted
+        rental_order.action_cancel()
+        self.assertFalse(OccupancyObj.search(domain))
+        # the ledger can be rebuilt from the order lines
+        rental_order.action_draft()
+        OccupancyObj._rebuild_occupancy()
+        occupancies = OccupancyObj.search(domain)
+        self.assertEqual(occupancies.mapped("reserved_qty"), [2, 2, 2, 2])
+
+    def test_03_check_availability_multi(self):
+        # RO 1  (qty: 2)    today -------- 10 (quotation)
+        # RO 2  (qty: 2)                          20 ---------- 30 (none)
+        # RO 3  (qty: 3)    today - 2 (order)
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 4
+        )
+        rental_order_1 = self.create_rental_order(self.today, self.date_10_day_later, 2)
+        rental_order_1.action_confirm()
+        rental_order_2 = self.create_rental_order(
+            self.date_20_day_later, self.date_30_day_later, 2
+        )
+        rental_order_3 = self.create_rental_order(self.today, self.date_2_day_later, 3)
+        orders = rental_order_1 | rental_order_2 | rental_order_3
+        orders.mapped("order_line").write({"concurrent_orders": "none"})
+        short_lines = orders.mapped("order_line")._check_rental_availability_multi()
+        self.assertEqual(
+            short_lines, (rental_order_1 | rental_order_3).mapped("order_line")
+        )
+        self.assertEqual(rental_order_1.order_line.concurrent_orders, "quotation")
+        self.assertEqual(rental_order_2.order_line.concurrent_orders, "none")
+        self.assertEqual(rental_order_3.order_line.concurrent_orders, "order")
+        # the single line check gives the same result
+        res = rental_order_3.order_line._check_rental_availability()
+        self.assertTrue(res.get("warning"))
+        self.assertEqual(rental_order_3.order_line.concurrent_orders, "order")
+
+    def test_04_concurrent_order_lines(self):
+        # RO 1  (qty: 1)              5 ----- 10
+        # RO 2  (qty: 1)    today ----------------------- 20
+        # RO 3  (qty: 1)                                  20 ---- 25
+        # RO 4  (qty: 1)                                              27 - 30
+        rental_order_1 = self.create_rental_order(
+            self.date_5_day_later, self.date_10_day_later, 1
+        )
+        rental_order_2 = self.create_rental_order(self.today, self.date_20_day_later, 1)
+        rental_order_3 = self.create_rental_order(
+            self.date_20_day_later, self.date_25_day_later, 1
+        )
+        self.create_rental_order(self.date_27_day_later, self.date_30_day_later, 1)
+        # a period containing a whole rental is concurrent to it
+        self.assertEqual(
+            rental_order_2.order_line._get_concurrent_order_lines(),
+            (rental_order_1 | rental_order_3).mapped("order_line"),
+        )
+        # so is a period contained in a rental
+        self.assertEqual(
+            rental_order_1.order_line._get_concurrent_order_lines(),
+            rental_order_2.order_line,
+        )
+        rental_order_3.action_cancel()
+        self.assertEqual(
+            rental_order_2.order_line._get_concurrent_order_lines(),
+            rental_order_1.order_line,
+        )
+
+    def test_05_availability_calendar(self):
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 4
+        )
+        self.create_rental_order(self.date_2_day_later, self.date_5_day_later, 2)
+        self.create_rental_order(
+            self.date_5_day_later, self.date_10_day_later, 1
+        ).action_confirm()
+        self.create_rental_order(self.today, self.date_10_day_later, 1).action_cancel()
+        calendar = self.productA.get_rental_availability_calendar(
+            date_start=self.today, days=12, warehouse_id=self.warehouse0.id
+        )
+        self.assertEqual(
+            calendar[self.productA.id], [4, 4, 2, 2, 2, 1, 3, 3, 3, 3, 3, 4]
+        )
+        # the horizon starting in the middle of a rental
+        calendar = self.productA.get_rental_availability_calendar(
+            date_start=self.date_5_day_later, days=3, warehouse_id=self.warehouse0.id
+        )
+        self.assertEqual(calendar[self.productA.id], [1, 3, 3])
+
+    def test_06_rental_free_products(self):
+        productB = self.env["product.product"].create(
+            {
+                "name": "Product B",
+                "type": "product",
+                "rental": True,
+                "rental_of_day": True,
+                "rental_price_day": 100,
+            }
+        )
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 4
+        )
+        self.env["stock.quant"]._update_available_quantity(
+            productB, self.warehouse0.rental_in_location_id, 1
+        )
+        self.create_rental_order(self.date_2_day_later, self.date_5_day_later, 3)
+        ProductObj = self.env["product.product"]
+        product_ids = ProductObj.get_rental_free_products(
+            self.today, self.date_10_day_later, 1, self.warehouse0.id
+        )
+        self.assertIn(self.productA.id, product_ids)
+        self.assertIn(productB.id, product_ids)
+        product_ids = ProductObj.get_rental_free_products(
+            self.today, self.date_10_day_later, 2, self.warehouse0.id
+        )
+        self.assertNotIn(self.productA.id, product_ids)
+        self.assertNotIn(productB.id, product_ids)
+        # search filter on the free quantity of the period in the context
+        products = ProductObj.with_context(
+            rental_start_date=self.today,
+            rental_end_date=self.date_2_day_later,
+            warehouse=self.warehouse0.id,
+        ).search([("rental_free_qty", ">=", 1)])
+        self.assertIn(self.productA, products)
+        self.assertIn(productB, products)
+        self.assertEqual(
+            self.productA.with_context(
+                rental_start_date=self.date_20_day_later,
+                warehouse=self.warehouse0.id,
+            ).rental_free_qty,
+            4,
+        )
+        products = ProductObj.with_context(
+            rental_start_date=self.date_5_day_later,
+            warehouse=self.warehouse0.id,
+        ).search([("rental_free_qty", ">=", 2)])
+        self.assertNotIn(self.productA, products)
+
+    def test_07_rental_suggestion(self):
+        productB = self.env["product.product"].create(
+            {
+                "name": "Product B",
+                "type": "product",
+                "rental": True,
+                "rental_of_day": True,
+                "rental_price_day": 100,
+                "categ_id": self.productA.categ_id.id,
+            }
+        )
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 2
+        )
+        self.env["stock.quant"]._update_available_quantity(
+            productB, self.warehouse0.rental_in_location_id, 2
+        )
+        # RO 1  (qty: 1)    today ------ 5
+        # RO 2  (qty: 1)           2 ----------- 10
+        # RO 3  (qty: 1)                            15 - 20
+        # RO 4  (qty: 2)           2 -- 5
+        self.create_rental_order(self.today, self.date_5_day_later, 1)
+        self.create_rental_order(self.date_2_day_later, self.date_10_day_later, 1)
+        self.create_rental_order(self.date_15_day_later, self.date_20_day_later, 1)
+        rental_order_4 = self.create_rental_order(
+            self.date_2_day_later, self.date_5_day_later, 2
+        )
+        res = rental_order_4.order_line._check_rental_availability()
+        # 4 free days in a row for 2 units start on day 11
+        self.assertEqual(
+            res["suggestion"]["start_date"], self.today + relativedelta(days=11)
+        )
+        self.assertEqual(res["suggestion"]["products"], productB)
+        self.assertIn(productB.display_name, res["warning"]["message"])
+
+    def test_08_cron_update_concurrent_orders(self):
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 2
+        )
+        self.env["rental.occupancy.change"]._pop_changes()
+        rental_order_1 = self.create_rental_order(self.today, self.date_10_day_later, 2)
+        rental_order_2 = self.create_rental_order(
+            self.date_5_day_later, self.date_15_day_later, 1
+        )
+        line_1 = rental_order_1.order_line
+        line_2 = rental_order_2.order_line
+        (line_1 | line_2).write({"concurrent_orders": "none"})
+        self.env["sale.order.line"]._cron_update_concurrent_orders()
+        self.assertEqual(line_1.concurrent_orders, "quotation")
+        self.assertEqual(line_2.concurrent_orders, "quotation")
+        self.assertEqual(
+            self.env["sale.order.line"].search(
+                [
+                    ("id", "in", (line_1 | line_2).ids),
+                    ("concurrent_orders", "in", ["quotation", "order"]),
+                ]
+            ),
+            line_1 | line_2,
+        )
+        # nothing changed since the last run
+        line_1.write({"concurrent_orders": "none"})
+        self.env["sale.order.line"]._cron_update_concurrent_orders()
+        self.assertEqual(line_1.concurrent_orders, "none")
+        rental_order_2.action_cancel()
+        self.env["sale.order.line"]._cron_update_concurrent_orders()
+        self.assertEqual(line_1.concurrent_orders, "none")
+        self.assertEqual(line_2.concurrent_orders, "none")
+        # only the lines overlapping the changed days are checked again
+        line_3 = self.create_rental_order(
+            self.today, self.date_2_day_later, 1
+        ).order_line
+        self.env["sale.order.line"]._cron_update_concurrent_orders()
+        self.assertEqual(line_3.concurrent_orders, "quotation")
+        (line_1 | line_3).write({"concurrent_orders": "none"})
+        self.create_rental_order(self.date_10_day_later, self.date_15_day_later, 1)
+        self.env["sale.order.line"]._cron_update_concurrent_orders()
+        self.assertEqual(line_1.concurrent_orders, "quotation")
+        self.assertEqual(line_3.concurrent_orders, "none")
+
+    def test_09_strict_availability(self):
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 2
+        )
+        rental_order_1 = self.create_rental_order(self.today, self.date_10_day_later, 2)
+        rental_order_2 = self.create_rental_order(
+            self.date_5_day_later, self.date_15_day_later, 1
+        )
+        rental_order_1.action_confirm()
+        self.env.user.company_id.rental_strict_availability = True
+        with self.assertRaises(exceptions.UserError), self.env.cr.savepoint():
+            rental_order_2.action_confirm()
+        rental_order_2.invalidate_cache()
+        self.assertEqual(rental_order_2.state, "draft")
+        rental_order_3 = self.create_rental_order(
+            self.date_15_day_later, self.date_20_day_later, 2
+        )
+        rental_order_3.action_confirm()
+        self.assertEqual(rental_order_3.state, "sale")
+        # the confirmation conflicts with the concurrent ones of the product
+        version = self.env["rental.occupancy.version"].search(
+            [("product_id", "=", self.productA.id)]
+        )
+        self.assertEqual(version.version, 1)
+
+    def test_10_warehouse_free_qtys(self):
+        warehouse1 = self.env["stock.warehouse"].create(
+            {"name": "Second Depot", "code": "WH1"}
+        )
+        warehouse1.write({"rental_allowed": True})
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, self.warehouse0.rental_in_location_id, 2
+        )
+        self.env["stock.quant"]._update_available_quantity(
+            self.productA, warehouse1.rental_in_location_id, 3
+        )
+        self.create_rental_order(self.today, self.date_10_day_later, 2)
+        rental_order_2 = self.create_rental_order(
+            self.date_5_day_later, self.date_15_day_later, 1
+        )
+        line = rental_order_2.order_line
+        free_qtys = line._get_rental_warehouse_free_qtys()[line.id]
+        # each depot only subtracts the rentals of its own stock
+        self.assertEqual(free_qtys[self.warehouse0.id], 0)
+        self.assertEqual(free_qtys[warehouse1.id], 3)
+        res = line._check_rental_availability()
+        self.assertEqual(res["warehouses"], warehouse1)
+        self.assertIn("Second Depot (3.00)", res["warning"]["message"])
@@ -40,7 +40,7 @@ Create a rental order:
 
 Please also see the usage section of sale_rental and rental_base module.
     """,
-    "version": "12.0.1.0.2",
+    "version": "12.0.1.1.0",
     "category": "Rental",
     "author": "Odoo Community Association (OCA), Elego Software Solutions GmbH",
     "website": "https://github.com/OCA/vertical-rental",
@@ -48,6 +48,8 @@ Please also see the usage section of sale_rental and rental_base module.
         "rental_base",
     ],
     "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/sale_view.xml",
         "views/product_view.xml",
         "views/res_company_view.xml",
@@ -4,3 +4,5 @@ from . import sale
 from . import product
 from . import product_pricelist_item
 from . import res_company
+from . import rental_stock_version
+from . import stock
@@ -3,6 +3,8 @@
 
 from odoo import _, api, exceptions, fields, models
 
+from .rental_stock_version import RENTAL_STOCK_CACHE
+
 
 class ProductProduct(models.Model):
     _inherit = "product.product"
@@ -379,3 +381,38 @@ class ProductProduct(models.Model):
             ext_vals["expense_analytic_account_id"] = res.expense_analytic_account_id.id
         res.write(ext_vals)
         return res
+
+    @api.multi
+    def _get_rental_location_qties(self, location_id):
+        """Return the stock quantities of the products in a location.
+
+        The quantities are cached per (product, location) in the process and
+        reused as long as no quant or stock move of the product changed, see
+        rental.stock.version.
+
+        :return: dict mapping product ids to copies of the quantities
+            returned by _compute_quantities_dict()
+        """
+        if not self:
+            return {}
+        dbname = self.env.cr.dbname
+        versions = self.env["rental.stock.version"]._get_versions(self.ids)
+        res = {}
+        missing = self.browse()
+        for product in self:
+            cached = RENTAL_STOCK_CACHE.get((dbname, product.id, location_id))
+            if cached and cached[0] == versions[product.id]:
+                res[product.id] = dict(cached[1])
+            else:
+                missing |= product
+        if missing:
+            qties = missing.with_context(location=location_id)._compute_quantities_dict(
+                False, False, False
+            )
+            for product in missing:
+                res[product.id] = qties[product.id]
+                RENTAL_STOCK_CACHE[(dbname, product.id, location_id)] = (
+                    versions[product.id],
+                    dict(qties[product.id]),
+                )
+        return res
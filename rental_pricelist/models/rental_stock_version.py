@@ -0,0 +1,95 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models
+from odoo.tools import sql
+from odoo.tools.lru import LRU
+
+# (dbname, product_id, location_id) -> (version, quantities), shared by the
+# environments of the process and validated against the database version.
+RENTAL_STOCK_CACHE = LRU(8192)
+
+
+class RentalStockVersion(models.Model):
+    _name = "rental.stock.version"
+    _description = "Stock Version of Rented Products"
+    _log_access = False
+
+    product_id = fields.Many2one(
+        comodel_name="product.product",
+        string="Product",
+        required=True,
+        ondelete="cascade",
+    )
+
+    version = fields.Integer(
+        string="Version",
+        help="Added whenever a quant or stock move of the product changes, "
+        "the highest one is the current version of the product.",
+    )
+
+    @api.model_cr
+    def init(self):
+        self._cr.execute("CREATE SEQUENCE IF NOT EXISTS rental_stock_version_seq")
+        sql.create_index(
+            self._cr,
+            "rental_stock_version_product_id_version_index",
+            self._table,
+            ["product_id", "version"],
+        )
+
+    @api.model
+    def _bump_versions(self, product_ids):
+        """Invalidate the cached stock quantities of the given products in
+        all workers.
+
+        A new version row is inserted per product instead of updating a
+        single one, so that concurrent stock operations on the same product
+        do not wait for each other. The versions are drawn from a sequence,
+        so a version seen in a transaction which is rolled back is never
+        reused.
+        """
+        product_ids = sorted({product_id for product_id in product_ids if product_id})
+        if not product_ids:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO rental_stock_version (product_id, version)
+            SELECT product_id, nextval('rental_stock_version_seq')
+            FROM unnest(%s::integer[]) AS product_id
+            """,
+            (product_ids,),
+        )
+        self.invalidate_cache(fnames=["version"])
+
+    @api.model
+    def _get_versions(self, product_ids):
+        """Return the stock version per product id, 0 if never bumped."""
+        self.env.cr.execute(
+            """
+            SELECT product_id, MAX(version)
+            FROM rental_stock_version
+            WHERE product_id IN %s
+            GROUP BY product_id
+            """,
+            (tuple(product_ids),),
+        )
+        versions = dict(self.env.cr.fetchall())
+        return {product_id: versions.get(product_id, 0) for product_id in product_ids}
+
+    @api.model
+    def _cron_purge_versions(self):
+        """Delete the versions which are not the current one of their
+        product anymore.
+        """
+        self.env.cr.execute(
+            """
+            DELETE FROM rental_stock_version v
+            USING (
+                SELECT product_id, MAX(version) AS version
+                FROM rental_stock_version
+                GROUP BY product_id
+            ) AS current
+            WHERE v.product_id = current.product_id
+                AND v.version < current.version
+            """
+        )
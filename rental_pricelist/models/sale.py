@@ -117,12 +117,11 @@ class SaleOrderLine(models.Model):
         product_uom = self.product_id.rented_product_id.uom_id
         warehouse = self.order_id.warehouse_id
         rental_in_location = warehouse.rental_in_location_id
-        rented_product_ctx = self.with_context(
-            location=rental_in_location.id
-        ).product_id.rented_product_id
-        in_location_available_qty = (
-            rented_product_ctx.qty_available - rented_product_ctx.outgoing_qty
-        )
+        rented_product = self.product_id.rented_product_id
+        qties = rented_product._get_rental_location_qties(rental_in_location.id)[
+            rented_product.id
+        ]
+        in_location_available_qty = qties["qty_available"] - qties["outgoing_qty"]
         compare_qty = float_compare(
             in_location_available_qty,
             self.rental_qty,
@@ -0,0 +1,80 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from odoo import api, models
+
+
+def _get_rental_product_ids(records):
+    """Return the ids of the rentable products of quants or stock moves,
+    the only ones whose stock quantities are cached.
+    """
+    return records.mapped("product_id").filtered("rental").ids
+
+
+class StockQuant(models.Model):
+    _inherit = "stock.quant"
+
+    def _get_rental_stock_fields(self):
+        """Fields of the quants the quantities on hand depend on."""
+        return {"product_id", "location_id", "quantity"}
+
+    @api.model
+    def create(self, vals):
+        quant = super().create(vals)
+        self.env["rental.stock.version"]._bump_versions(_get_rental_product_ids(quant))
+        return quant
+
+    @api.multi
+    def write(self, vals):
+        if not self._get_rental_stock_fields() & set(vals):
+            return super().write(vals)
+        product_ids = _get_rental_product_ids(self)
+        res = super().write(vals)
+        self.env["rental.stock.version"]._bump_versions(
+            product_ids + _get_rental_product_ids(self)
+        )
+        return res
+
+    @api.multi
+    def unlink(self):
+        product_ids = _get_rental_product_ids(self)
+        res = super().unlink()
+        self.env["rental.stock.version"]._bump_versions(product_ids)
+        return res
+
+
+class StockMove(models.Model):
+    _inherit = "stock.move"
+
+    def _get_rental_stock_fields(self):
+        """Fields of the moves the forecasted quantities depend on."""
+        return {
+            "state",
+            "product_id",
+            "product_uom_qty",
+            "location_id",
+            "location_dest_id",
+        }
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        self.env["rental.stock.version"]._bump_versions(_get_rental_product_ids(moves))
+        return moves
+
+    @api.multi
+    def write(self, vals):
+        if not self._get_rental_stock_fields() & set(vals):
+            return super().write(vals)
+        product_ids = _get_rental_product_ids(self)
+        res = super().write(vals)
+        self.env["rental.stock.version"]._bump_versions(
+            product_ids + _get_rental_product_ids(self)
+        )
+        return res
+
+    @api.multi
+    def unlink(self):
+        product_ids = _get_rental_product_ids(self)
+        res = super().unlink()
+        self.env["rental.stock.version"]._bump_versions(product_ids)
+        return res
@@ -451,6 +451,37 @@ class TestRentalPricelist(RentalStockCommon):
             "The product Product D is not correctly configured.", e.exception.name
         )
 
+    def test_05_rental_location_qties_cache(self):
+        """
+        check that the cached stock quantities follow the quant changes
+        """
+        location = self.warehouse0.rental_in_location_id
+        qties = self.productA._get_rental_location_qties(location.id)
+        self.assertEqual(qties[self.productA.id]["qty_available"], 0)
+        self.env["stock.quant"]._update_available_quantity(self.productA, location, 3)
+        qties = self.productA._get_rental_location_qties(location.id)
+        self.assertEqual(qties[self.productA.id]["qty_available"], 3)
+        self.env["stock.quant"]._update_available_quantity(self.productA, location, -1)
+        qties = self.productA._get_rental_location_qties(location.id)
+        self.assertEqual(qties[self.productA.id]["qty_available"], 2)
+        # the cached quantities are not altered through the returned ones
+        qties[self.productA.id]["qty_available"] = 10
+        qties = self.productA._get_rental_location_qties(location.id)
+        self.assertEqual(qties[self.productA.id]["qty_available"], 2)
+        # only the current version of the product is kept by the purge
+        VersionObj = self.env["rental.stock.version"]
+        domain = [("product_id", "=", self.productA.id)]
+        self.assertGreater(VersionObj.search_count(domain), 1)
+        version = VersionObj._get_versions(self.productA.ids)[self.productA.id]
+        VersionObj._cron_purge_versions()
+        self.assertEqual(VersionObj.search(domain).mapped("version"), [version])
+        # the products which are not rented out have no version
+        product = self.env["product.product"].create(
+            {"name": "Product Not Rented", "type": "product"}
+        )
+        self.env["stock.quant"]._update_available_quantity(product, location, 1)
+        self.assertFalse(VersionObj.search([("product_id", "=", product.id)]))
+
     def test_variant_images(self):
         """Check option rental_service_copy_image"""
         f = io.BytesIO()
@@ -2,7 +2,7 @@
 
 {
     "name": "Rental Timeline",
-    "version": "12.0.1.0.0",
+    "version": "12.0.1.3.0",
     "category": "Rental",
     "summary": "Timeline view for rental orders and rental products",
     "usage": """
@@ -11,17 +11,22 @@ Just install this module. No further configuration is necessary.
     "author": "elego Software Solutions GmbH, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/vertical-rental",
     "depends": [
+        "bus",
         "web_timeline",
         "rental_base",
     ],
     "data": [
         "security/ir.model.access.csv",
+        "data/ir_cron.xml",
+        "data/ir_actions_server.xml",
         "views/assets.xml",
         "views/product_timeline_view.xml",
         "views/product_view.xml",
     ],
     "demo": [],
-    "qweb": [],
+    "qweb": [
+        "static/src/xml/rental_timeline.xml",
+    ],
     "application": False,
     "license": "AGPL-3",
 }
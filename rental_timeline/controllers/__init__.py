@@ -0,0 +1,3 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from . import main
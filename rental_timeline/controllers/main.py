@@ -0,0 +1,169 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import werkzeug
+
+import odoo
+from odoo import api, http
+from odoo.http import content_disposition, request
+
+CSV_HEADER = [
+    "id",
+    "date_start",
+    "date_end",
+    "type",
+    "product",
+    "order",
+    "partner",
+    "warehouse",
+]
+
+
+def _csv_chunks(batches):
+    """Yield the CSV export of the batches of timeline rows, one chunk of
+    text per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for rows in batches:
+        for row in rows:
+            writer.writerow(
+                [
+                    value.isoformat(" ") if isinstance(value, datetime) else value
+                    for value in row
+                ]
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ical_text(value):
+    """Escape a text value as defined by RFC 5545."""
+    return (
+        (value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _ical_line(line):
+    """Fold a content line to 75 octets as defined by RFC 5545."""
+    data = line.encode()
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        # do not split a multibyte character
+        while cut and data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data = data[cut:]
+    parts.append(data.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ical_chunks(batches, dbname):
+    """Yield the iCalendar export of the batches of timeline rows, one
+    chunk of text per batch.
+    """
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield "".join(
+        _ical_line(line)
+        for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//rental-vertical//Rental Timeline//EN",
+            "CALSCALE:GREGORIAN",
+        ]
+    )
+    for rows in batches:
+        lines = []
+        for row in rows:
+            res_id, date_start, date_end, type_, product, order, partner, wh = row
+            lines += [
+                "BEGIN:VEVENT",
+                "UID:product.timeline-%s@%s" % (res_id, dbname),
+                "DTSTAMP:%s" % stamp,
+                # all-day events, the end date of the rentals is inclusive
+                "DTSTART;VALUE=DATE:%s" % date_start.strftime("%Y%m%d"),
+                "DTEND;VALUE=DATE:%s"
+                % (date_end + timedelta(days=1)).strftime("%Y%m%d"),
+                "SUMMARY:%s"
+                % _ical_text(" - ".join(v for v in (product, partner) if v)),
+                "DESCRIPTION:%s"
+                % _ical_text("\n".join(v for v in (order, type_, wh) if v)),
+                "LOCATION:%s" % _ical_text(wh),
+                "END:VEVENT",
+            ]
+        yield "".join(_ical_line(line) for line in lines)
+    yield _ical_line("END:VCALENDAR")
+
+
+class RentalTimelineExport(http.Controller):
+    @http.route(
+        "/rental_timeline/export/<string:export_format>",
+        type="http",
+        auth="user",
+        methods=["GET", "POST"],
+    )
+    def export(self, export_format, domain="[]", product_id=None, warehouse_id=None):
+        """Stream the timeline items of a domain, optionally restricted to a
+        product or a warehouse, as CSV (csv) or iCalendar (ics).
+
+        The rows are read in batches from a server-side cursor of a
+        dedicated database cursor while the response is sent, so that the
+        memory used does not depend on the number of items.
+        """
+        if export_format not in ("csv", "ics"):
+            raise request.not_found()
+        try:
+            domain = json.loads(domain)
+            if not isinstance(domain, list):
+                raise ValueError(domain)
+            if product_id:
+                domain.append(("product_id", "=", int(product_id)))
+            if warehouse_id:
+                domain.append(("warehouse_id", "=", int(warehouse_id)))
+        except ValueError:
+            raise werkzeug.exceptions.BadRequest()
+        TimelineObj = request.env["product.timeline"]
+        TimelineObj.check_access_rights("read")
+        query, params = TimelineObj._get_export_query(domain)
+        dbname = request.env.cr.dbname
+        uid = request.env.uid
+        context = dict(request.env.context)
+
+        def generate():
+            with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                batches = env["product.timeline"]._iter_export_rows(query, params)
+                if export_format == "csv":
+                    chunks = _csv_chunks(batches)
+                else:
+                    chunks = _ical_chunks(batches, dbname)
+                for chunk in chunks:
+                    yield chunk.encode()
+
+        if export_format == "csv":
+            content_type = "text/csv; charset=utf-8"
+        else:
+            content_type = "text/calendar; charset=utf-8"
+        return http.Response(
+            generate(),
+            headers=[
+                ("Content-Type", content_type),
+                (
+                    "Content-Disposition",
+                    content_disposition("rental_timeline.%s" % export_format),
+                ),
+            ],
+            direct_passthrough=True,
+        )
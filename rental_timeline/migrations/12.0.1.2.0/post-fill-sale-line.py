@@ -0,0 +1,11 @@
+def migrate(cr, version):
+    cr.execute(
+        """
+        UPDATE product_timeline t
+        SET sale_line_id = t.res_id
+        FROM sale_order_line l
+        WHERE t.res_model = 'sale.order.line'
+            AND l.id = t.res_id
+            AND t.sale_line_id IS NULL
+        """
+    )
@@ -0,0 +1,15 @@
+def migrate(cr, version):
+    # the values of the tooltips are not stored anymore
+    cr.execute(
+        """
+        ALTER TABLE product_timeline
+            DROP COLUMN IF EXISTS date_start_formated,
+            DROP COLUMN IF EXISTS date_end_formated,
+            DROP COLUMN IF EXISTS type_formated,
+            DROP COLUMN IF EXISTS product_categ_name,
+            DROP COLUMN IF EXISTS partner_shipping_address,
+            DROP COLUMN IF EXISTS rental_period,
+            DROP COLUMN IF EXISTS amount,
+            DROP COLUMN IF EXISTS warehouse_name
+        """
+    )
@@ -3,6 +3,7 @@
 from . import sale
 from . import product
 from . import product_timeline
+from . import product_timeline_queue
 from . import ir_view
 from . import ir_actions
 from . import res_partner
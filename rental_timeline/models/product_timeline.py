@@ -1,12 +1,34 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 
 import logging
+from collections import OrderedDict
 from datetime import datetime
+from weakref import WeakKeyDictionary
 
-from odoo import api, fields, models
+from dateutil.relativedelta import relativedelta
+
+import odoo
+from odoo import SUPERUSER_ID, api, fields, models, tools
+from odoo.osv import expression
+from odoo.tools import split_every, sql
 
 _logger = logging.getLogger(__name__)
 
+# fields grouping the products in the rental timeline view
+PARENT_GROUP_FIELDS = ("product_categ_id", "partner_id", "order_name")
+# groups and bucket sizes of the utilization mode of the rental timeline view
+UTILIZATION_GROUP_FIELDS = ("product_id", "product_categ_id")
+UTILIZATION_INTERVALS = ("day", "week", "month")
+# age in months of the ended timeline objects archived as history
+HISTORY_MONTHS = 12
+# bus channel of the changes of the timeline objects
+TIMELINE_CHANNEL = "rental_timeline.product_timeline"
+# number of changed timeline objects above which the clients reload instead
+# of reading the changed ones
+TIMELINE_MAX_CHANGES = 1000
+# changes of the timeline objects per cursor, sent on the bus after commit
+TIMELINE_CHANGES = WeakKeyDictionary()
+
 
 class ProductTimeline(models.Model):
     _name = "product.timeline"
@@ -26,6 +48,14 @@ class ProductTimeline(models.Model):
         require=True,
     )
 
+    sale_line_id = fields.Many2one(
+        string="Order Line",
+        comodel_name="sale.order.line",
+        help="Origin order line of timeline items about order lines.",
+        ondelete="cascade",
+        index=True,
+    )
+
     click_res_model = fields.Char(
         string="Clickable Data Model",
         help="This is a technical field to define which kind "
@@ -45,6 +75,7 @@ class ProductTimeline(models.Model):
     date_start = fields.Datetime(
         string="Date Start",
         require=True,
+        index=True,
     )
 
     date_start_formated = fields.Char(
@@ -52,13 +83,13 @@ class ProductTimeline(models.Model):
         help="This field contains the start date as string "
         "without time to show it in rental timeline "
         "mouseover view.",
-        compute="_compute_required_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     date_end = fields.Datetime(
         string="Date End",
         require=True,
+        index=True,
     )
 
     date_end_formated = fields.Char(
@@ -66,8 +97,7 @@ class ProductTimeline(models.Model):
         help="This field contains the end date as string "
         "without time to show it in rental timeline "
         "mouseover view.",
-        compute="_compute_required_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     product_id = fields.Many2one(
@@ -82,6 +112,15 @@ class ProductTimeline(models.Model):
         store=True,
     )
 
+    history = fields.Boolean(
+        string="History",
+        help="Set on the timeline objects which ended long ago. They are "
+        "archived and only shown in the rental timeline view when the "
+        "history is included.",
+        readonly=True,
+        copy=False,
+    )
+
     product_name = fields.Char(
         string="Product Name",
         help="This field contains the product name as string "
@@ -116,8 +155,7 @@ class ProductTimeline(models.Model):
         string="Type (Formatted)",
         help="This field contains the timeline type as string "
         "to show it in rental timeline mouseover view.",
-        compute="_compute_required_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     has_clues = fields.Char(
@@ -139,8 +177,7 @@ class ProductTimeline(models.Model):
     )
 
     product_categ_name = fields.Char(
-        compute="_compute_required_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     name = fields.Char(
@@ -169,8 +206,7 @@ class ProductTimeline(models.Model):
         string="Shipping address",
         help="This field contains the shipping address as string "
         "to show it in rental timeline mouseover view.",
-        compute="_compute_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     currency_id = fields.Many2one(
@@ -197,14 +233,12 @@ class ProductTimeline(models.Model):
         string="Rental Duration",
         help="This field contains the rental duration as string "
         "to show it in rental timeline mouseover view.",
-        compute="_compute_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     amount = fields.Char(
         string="Amount",
-        compute="_compute_fields",
-        store=True,
+        compute="_compute_tooltip_fields",
     )
 
     warehouse_id = fields.Many2one(
@@ -219,7 +253,6 @@ class ProductTimeline(models.Model):
         help="This field contains the warehouse name as string "
         "to show it in rental timeline mouseover view.",
         compute="_compute_warehouse_name",
-        store=True,
     )
 
     _sql_constraints = [
@@ -230,48 +263,560 @@ class ProductTimeline(models.Model):
         ),
     ]
 
+    @api.model_cr
+    def init(self):
+        sql.create_index(
+            self._cr,
+            "product_timeline_res_model_res_id_index",
+            self._table,
+            ["res_model", "res_id"],
+        )
+        # the searches of the timeline view only read the active timelines
+        self._cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS product_timeline_active_date_end_index
+            ON product_timeline (date_end, date_start)
+            WHERE active
+            """
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        timelines = super().create(vals_list)
+        self._push_changes("created", timelines.ids)
+        return timelines
+
+    @api.multi
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get("date_end"):
+            cutoff = fields.Datetime.now() - relativedelta(months=HISTORY_MONTHS)
+            if fields.Datetime.to_datetime(vals["date_end"]) >= cutoff:
+                # a rental extended to a recent date is not history anymore
+                self.filtered("history").write({"history": False})
+        return res
+
+    @api.multi
+    def _write(self, vals):
+        res = super()._write(vals)
+        self._push_changes("updated", self.ids, vals.keys())
+        return res
+
+    @api.multi
+    def unlink(self):
+        timeline_ids = self.ids
+        res = super().unlink()
+        self._push_changes("deleted", timeline_ids)
+        return res
+
+    @api.model
+    def _push_changes(self, operation, timeline_ids, fnames=()):
+        """Collect the changes of the timeline objects of the transaction,
+        which are sent on the bus in one message once it is committed.
+
+        :param operation: "created", "updated" or "deleted"
+        """
+        if not timeline_ids:
+            return
+        cr = self.env.cr
+        changes = TIMELINE_CHANGES.get(cr)
+        if changes is None:
+            changes = TIMELINE_CHANGES[cr] = {
+                "created": set(),
+                "updated": set(),
+                "deleted": set(),
+                "fields": set(),
+            }
+            dbname = cr.dbname
+
+            def send():
+                self._send_changes(dbname, TIMELINE_CHANGES.pop(cr, None))
+
+            cr.after("commit", send)
+            cr.after("rollback", lambda: TIMELINE_CHANGES.pop(cr, None))
+        changes[operation].update(timeline_ids)
+        changes["fields"].update(fnames)
+
+    @api.model
+    def _send_changes(self, dbname, changes):
+        """Send the changes of the timeline objects of a committed
+        transaction on the bus.
+        """
+        if not changes:
+            return
+        message = self._get_changes_message(changes)
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env["bus.bus"].sendone(TIMELINE_CHANNEL, message)
+
+    @api.model
+    def _get_changes_message(self, changes):
+        """Return the bus message of the changes of a transaction, asking the
+        clients to reload when more than TIMELINE_MAX_CHANGES timeline
+        objects changed, e.g. on a rebuild.
+        """
+        deleted = changes["deleted"]
+        created = changes["created"] - deleted
+        updated = changes["updated"] - created - deleted
+        if len(created) + len(updated) + len(deleted) > TIMELINE_MAX_CHANGES:
+            return {"reload": True}
+        return {
+            "created": sorted(created),
+            "updated": sorted(updated),
+            "deleted": sorted(deleted),
+            "fields": sorted(changes["fields"]),
+        }
+
     @api.depends("res_id", "res_model")
     def _compute_fields(self):
         """This function calculates the computed fields for model sale.order.line
         Since It will only be triggered, if res_id or res_model is changed.
         For updating of further infos of the related model it should be called
         for example in _reset_timeline of the related res_model.
+
+        The origin records are browsed all at once to benefit from the
+        prefetching.
         """
-        lang = self.env["res.lang"].search(
-            [("code", "=", self.env.user.company_id.partner_id.lang)]
+        timelines = self.filtered(lambda l: l.res_model == "sale.order.line")
+        order_lines = (
+            self.env["sale.order.line"]
+            .browse(list(set(timelines.mapped("res_id"))))
+            .exists()
         )
-        for line in self:
-            if line.res_model == "sale.order.line":
-                obj = (
-                    self.env[line.res_model]
-                    .browse(line.res_id)
-                    .with_context(lang=lang.code)
-                )
-                order_obj = obj.order_id
-                line.order_name = order_obj.name
-                line.name = order_obj.partner_id.commercial_partner_id.name
-                line.partner_id = order_obj.partner_id.id
-                line.partner_shipping_id = order_obj.partner_shipping_id.id
-                line.partner_shipping_address = (
-                    order_obj.partner_shipping_id._display_address()
-                )
-                line.warehouse_id = order_obj.warehouse_id.id
-                line.currency_id = obj.currency_id.id
-                line.price_subtotal = obj.price_subtotal
-                line.number_of_days = obj.number_of_days
-                line.time_uom = obj.product_uom
-                line.rental_period = "{product_uom_qty} {product_uom}".format(
-                    product_uom_qty=int(obj.product_uom_qty),
-                    product_uom=obj.product_uom.name,
+        order_lines_by_id = {obj.id: obj for obj in order_lines}
+        for line in timelines:
+            obj = order_lines_by_id.get(line.res_id)
+            if not obj:
+                continue
+            order_obj = obj.order_id
+            line.order_name = order_obj.name
+            line.name = order_obj.partner_id.commercial_partner_id.name
+            line.partner_id = order_obj.partner_id.id
+            line.partner_shipping_id = order_obj.partner_shipping_id.id
+            line.warehouse_id = order_obj.warehouse_id.id
+            line.currency_id = obj.currency_id.id
+            line.price_subtotal = obj.price_subtotal
+            line.number_of_days = obj.number_of_days
+            line.time_uom = obj.product_uom
+            line.has_clues = False
+
+    @api.model
+    def search_read_window(
+        self,
+        domain=None,
+        fields=None,
+        date_start=None,
+        date_end=None,
+        offset=0,
+        limit=None,
+        order=None,
+    ):
+        """Read the timeline items of the domain intersecting the window
+        between date_start and date_end, so that the timeline view only
+        loads the items around the displayed period.
+        """
+        return self.search_read(
+            self._get_window_domain(domain, date_start, date_end),
+            fields=fields,
+            offset=offset,
+            limit=limit,
+            order=order,
+        )
+
+    @api.model
+    def _get_window_domain(self, domain, date_start, date_end):
+        """Restrict a domain to the items intersecting a window."""
+        domain = list(domain or [])
+        if date_start:
+            domain = expression.AND([domain, [("date_end", ">=", date_start)]])
+        if date_end:
+            domain = expression.AND([domain, [("date_start", "<=", date_end)]])
+        return domain
+
+    @api.model
+    def get_timeline_groups(
+        self, domain=None, group_by=False, date_start=None, date_end=None
+    ):
+        """Return the groups of the rental timeline view for the items of
+        the domain intersecting the window between date_start and date_end,
+        as loaded by search_read_window(), aggregated with one read_group.
+
+        The items are grouped per product. Grouped by category, partner or
+        order, the product groups are nested in a group per category,
+        partner or order, and a product under several partners or orders
+        gets a group of its own under each of them.
+
+        :return: dict with the groups in the format of vis.js and the id of
+            the group of the items per key "product_id,parent"
+        """
+        parent_field = group_by in PARENT_GROUP_FIELDS and group_by
+        groupby = ["product_id", "product_categ_id"]
+        if parent_field and parent_field not in groupby:
+            groupby.append(parent_field)
+        rows = self.read_group(
+            self._get_window_domain(domain, date_start, date_end),
+            groupby,
+            groupby,
+            lazy=False,
+        )
+        product_groups = OrderedDict()
+        parent_groups = OrderedDict()
+        item_groups = {}
+        clone_groups = []
+        for row in rows:
+            product = row["product_id"]
+            # the products named "All..." are hidden as in the former renderer
+            if not product or product[1][:3] == "All":
+                continue
+            categ = row["product_categ_id"]
+            if product[0] not in product_groups:
+                product_groups[product[0]] = {
+                    "id": product[0],
+                    "content": product[1],
+                    "product_id": list(product),
+                    "tooltip_record": {
+                        "product_name": product[1],
+                        "product_categ_name": categ and categ[1] or False,
+                    },
+                }
+            parent = parent_field and row[parent_field]
+            if not parent:
+                continue
+            if isinstance(parent, (list, tuple)):
+                parent_key, parent_name = parent
+            else:
+                parent_key = parent_name = parent
+            if parent_key not in parent_groups:
+                parent_groups[parent_key] = {
+                    "content": parent_name,
+                    "nestedGroups": [],
+                    "tooltip_record": parent_field == "product_categ_id"
+                    and {"product_categ_name": parent_name},
+                }
+            item_groups["%s,%s" % (product[0], parent_key)] = product[0]
+            parent_groups[parent_key]["nestedGroups"].append(product[0])
+        # the ids of the other groups follow the ids of the products
+        max_id = max(list(product_groups) + [0])
+        for parent_group in parent_groups.values():
+            max_id += 1
+            parent_group["id"] = max_id
+        if parent_field in ("partner_id", "order_name"):
+            # give its own group to a product appearing under several parents
+            claimed = set()
+            for parent_key, parent_group in parent_groups.items():
+                nested_groups = []
+                for product_id in parent_group["nestedGroups"]:
+                    if product_id not in claimed:
+                        claimed.add(product_id)
+                        nested_groups.append(product_id)
+                        continue
+                    max_id += 1
+                    clone_groups.append(
+                        dict(
+                            product_groups[product_id],
+                            id=max_id,
+                            original_id=product_id,
+                        )
+                    )
+                    nested_groups.append(max_id)
+                    item_groups["%s,%s" % (product_id, parent_key)] = max_id
+                parent_group["nestedGroups"] = nested_groups
+        return {
+            "groups": list(product_groups.values())
+            + clone_groups
+            + list(parent_groups.values()),
+            "item_groups": item_groups,
+        }
+
+    @api.model
+    def get_utilization_buckets(
+        self, domain, date_start, date_end, group_by="product_id", interval="week"
+    ):
+        """Return the utilization of the products or categories per day,
+        week or month between date_start and date_end, for the utilization
+        mode of the rental timeline view.
+
+        The buckets are computed with one aggregate query over the dates of
+        the timeline items of the domain. The utilization of a bucket is the
+        number of days rented out by its items, weighted by their rented
+        quantity, divided by the number of days of the bucket times the
+        rentable quantity of the products rented out in it, i.e. their
+        quantity on hand and at least one per product.
+
+        :return: dict with the groups in the format of vis.js and the
+            buckets, each one with its group, start and end dates, number of
+            items and utilization
+        """
+        if group_by not in UTILIZATION_GROUP_FIELDS:
+            group_by = "product_id"
+        if interval not in UTILIZATION_INTERVALS:
+            interval = "week"
+        date_start = fields.Date.to_date(date_start)
+        date_end = fields.Date.to_date(date_end)
+        query = self._where_calc(domain or [])
+        self._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            """
+            WITH items AS (
+                SELECT "product_timeline"."{group_by}" AS group_id,
+                    "product_timeline"."product_id" AS product_id,
+                    COALESCE((
+                        SELECT rental_qty
+                        FROM sale_order_line
+                        WHERE id = "product_timeline"."sale_line_id"
+                    ), 1) AS qty,
+                    GREATEST("product_timeline"."date_start"::date, %s)
+                        AS item_start,
+                    LEAST("product_timeline"."date_end"::date, %s) + 1 AS item_end
+                FROM {from_clause}
+                WHERE {where_clause}
+                    AND "product_timeline"."date_start"::date <= %s
+                    AND "product_timeline"."date_end"::date >= %s
+            ),
+            buckets AS (
+                SELECT b::date AS bucket_start,
+                    (b + ('1 ' || %s)::interval)::date AS bucket_end
+                FROM generate_series(
+                    date_trunc(%s, %s::timestamp),
+                    %s::timestamp,
+                    ('1 ' || %s)::interval
+                ) AS b
+            )
+            SELECT i.group_id, b.bucket_start, b.bucket_end, COUNT(*),
+                ARRAY_AGG(DISTINCT i.product_id),
+                SUM(
+                    (
+                        LEAST(i.item_end, b.bucket_end)
+                        - GREATEST(i.item_start, b.bucket_start)
+                    ) * i.qty
+                ),
+                LEAST(b.bucket_end, %s + 1) - GREATEST(b.bucket_start, %s)
+            FROM items i
+            JOIN buckets b
+                ON i.item_start < b.bucket_end AND i.item_end > b.bucket_start
+            WHERE i.group_id IS NOT NULL
+            GROUP BY i.group_id, b.bucket_start, b.bucket_end
+            ORDER BY i.group_id, b.bucket_start
+            """.format(
+                group_by=group_by,
+                from_clause=from_clause,
+                where_clause=where_clause or "TRUE",
+            ),
+            [date_start, date_end]
+            + where_params
+            + [date_end, date_start]
+            + [interval, interval, date_start, date_end, interval]
+            + [date_end, date_start],
+        )
+        rows = self.env.cr.fetchall()
+        products = self.env["product.product"].browse(
+            list({product_id for row in rows for product_id in row[4]})
+        )
+        rentable_qties = {
+            product.id: max(product.qty_available, 1.0) for product in products
+        }
+        buckets = []
+        for row in rows:
+            group_id, start, end, count, product_ids, rented_days, days = row
+            rentable_qty = sum(rentable_qties[product_id] for product_id in product_ids)
+            buckets.append(
+                {
+                    "group": group_id,
+                    "start": fields.Date.to_string(start),
+                    "end": fields.Date.to_string(end),
+                    "items": count,
+                    "utilization": float(rented_days) / (days * rentable_qty),
+                }
+            )
+        groups = self.env[self._fields[group_by].comodel_name].browse(
+            list({bucket["group"] for bucket in buckets})
+        )
+        return {
+            "groups": [
+                {"id": group_id, "content": name}
+                for group_id, name in groups.name_get()
+            ],
+            "buckets": buckets,
+        }
+
+    @api.model
+    def _rebuild_sale_line_timelines(self, order_ids=None, batch_size=1000):
+        """Delete and recreate the timeline objects of the rental order lines
+        of the given orders, or of all orders when order_ids is None.
+
+        The timeline objects are inserted with one INSERT ... SELECT filling
+        the origin, dates, product and order columns, archived as history
+        when they ended more than HISTORY_MONTHS months ago, then the
+        computed fields are recomputed in batches of batch_size timeline
+        objects.
+
+        :return: number of timeline objects created
+        """
+        if order_ids is not None and not order_ids:
+            return 0
+        cr = self.env.cr
+        if order_ids is None:
+            where_clause = "TRUE"
+            params = []
+            cr.execute(
+                """
+                DELETE FROM product_timeline
+                WHERE res_model = 'sale.order.line'
+                RETURNING id
+                """
+            )
+        else:
+            where_clause = "l.order_id IN %s"
+            params = [tuple(order_ids)]
+            cr.execute(
+                """
+                DELETE FROM product_timeline t
+                USING sale_order_line l
+                WHERE t.res_model = 'sale.order.line'
+                    AND t.res_id = l.id
+                    AND l.order_id IN %s
+                RETURNING t.id
+                """,
+                params,
+            )
+        self._push_changes("deleted", [timeline_id for timeline_id, in cr.fetchall()])
+        # pylint: disable=sql-injection
+        cr.execute(
+            """
+            INSERT INTO product_timeline (
+                create_uid, create_date, write_uid, write_date,
+                res_model, res_id, sale_line_id, click_res_model, click_res_id,
+                date_start, date_end, product_id, product_tmpl_id,
+                product_categ_id, history, active, order_name, type
+            )
+            SELECT %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC',
+                'sale.order.line', l.id, l.id, 'sale.order', o.id,
+                l.start_date, l.end_date, p.id, p.product_tmpl_id,
+                pt.categ_id, h.history, p.active AND NOT h.history, o.name,
+                CASE WHEN l.state = 'sale' THEN 'rental' ELSE 'reserved' END
+            FROM sale_order_line l
+            JOIN sale_order o ON o.id = l.order_id
+            JOIN product_product s ON s.id = l.product_id
+            JOIN product_product p ON p.id = s.rented_product_id
+            JOIN product_template pt ON pt.id = p.product_tmpl_id
+            CROSS JOIN LATERAL (
+                SELECT l.end_date
+                    < (now() AT TIME ZONE 'UTC') - %s * interval '1 month'
+                    AS history
+            ) AS h
+            WHERE o.state != 'cancel'
+                AND l.rental_type IN ('new_rental', 'rental_extension')
+                AND l.start_date <= l.end_date
+                AND {}
+            ORDER BY l.id
+            RETURNING id
+            """.format(
+                where_clause
+            ),
+            [self.env.uid, self.env.uid, HISTORY_MONTHS] + params,
+        )
+        timeline_ids = [timeline_id for timeline_id, in cr.fetchall()]
+        self._push_changes("created", timeline_ids)
+        self.invalidate_cache()
+        for ids in split_every(batch_size, timeline_ids):
+            timelines = self.browse(ids)
+            timelines._recompute_fields()
+            for field in self._fields.values():
+                if field.compute == "_compute_required_fields":
+                    self.env.add_todo(field, timelines)
+            self.recompute()
+            self.invalidate_cache()
+        _logger.info("%s product timelines rebuilt", len(timeline_ids))
+        return len(timeline_ids)
+
+    @api.model
+    def _get_export_query(self, domain):
+        """Return the query and its parameters selecting the timeline items
+        of the domain readable by the current user, for the exports.
+        """
+        query = self._where_calc(domain or [])
+        self._apply_ir_rules(query, "read")
+        from_clause, where_clause, where_params = query.get_sql()
+        export_query = """
+            SELECT "product_timeline"."id", "product_timeline"."date_start",
+                "product_timeline"."date_end", "product_timeline"."type",
+                "product_timeline"."product_name", "product_timeline"."order_name",
+                (
+                    SELECT name FROM res_partner
+                    WHERE id = "product_timeline"."partner_id"
+                ),
+                (
+                    SELECT name FROM stock_warehouse
+                    WHERE id = "product_timeline"."warehouse_id"
                 )
-                currency = line.currency_id
-                line.amount = "{price_subtotal} {currency}".format(
-                    price_subtotal=lang.format(
-                        "%.2f", line.price_subtotal, grouping=True
-                    ),
-                    currency=currency.symbol,
+            FROM {from_clause}
+            WHERE {where_clause}
+            ORDER BY "product_timeline"."date_start", "product_timeline"."id"
+        """.format(
+            from_clause=from_clause, where_clause=where_clause or "TRUE"
+        )
+        return export_query, where_params
+
+    @api.model
+    def _iter_export_rows(self, query, params, batch_size=1000):
+        """Yield the rows of an export query in batches of batch_size rows,
+        fetched from a server-side cursor so that the memory used does not
+        depend on the number of rows.
+        """
+        cr = self.env.cr
+        # pylint: disable=sql-injection
+        cr.execute(
+            "DECLARE product_timeline_export NO SCROLL CURSOR FOR " + query, params
+        )
+        try:
+            while True:
+                cr.execute(
+                    "FETCH FORWARD %s FROM product_timeline_export", (batch_size,)
                 )
-                line.has_clues = False
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cr.execute("CLOSE product_timeline_export")
+
+    @api.multi
+    def _recompute_fields(self):
+        """Recompute the fields of _compute_fields for all the timelines in
+        one batch, instead of writing every field of every timeline.
+        """
+        for field in self._fields.values():
+            if field.compute == "_compute_fields":
+                self.env.add_todo(field, self)
+        self.recompute()
+
+    @api.model
+    def _get_tooltip_fields(self):
+        """Return the fields read by the tooltips of the rental timeline view."""
+        return [
+            "order_name",
+            "has_clues",
+            "date_start_formated",
+            "date_end_formated",
+            "number_of_days",
+            "rental_period",
+            "type",
+            "type_formated",
+            "partner_id",
+            "partner_shipping_address",
+            "warehouse_name",
+            "amount",
+        ]
+
+    @api.multi
+    def get_tooltip_values(self):
+        """Return the formatted values of the tooltip of a timeline item,
+        requested by the rental timeline view when the item is hovered.
+        """
+        self.ensure_one()
+        return self.read(self._get_tooltip_fields())[0]
 
     @api.model
     def _get_depends_fields(self, model):
@@ -308,55 +853,111 @@ class ProductTimeline(models.Model):
     @api.depends("warehouse_id", "warehouse_id.name")
     def _compute_warehouse_name(self):
         for line in self:
-            if line.warehouse_id:
-                line.warehouse_name = line.warehouse_id.display_name
+            line.warehouse_name = line.warehouse_id.display_name
+
+    @api.depends("product_id", "product_id.name")
+    def _compute_required_fields(self):
+        for line in self:
+            line.product_name = line.product_id.display_name
 
     @api.depends(
         "date_start",
         "date_end",
-        "product_id",
-        "product_id.name",
         "type",
         "product_categ_id",
-        "product_categ_id.name",
+        "partner_shipping_id",
+        "sale_line_id.product_uom_qty",
         "time_uom",
+        "price_subtotal",
+        "currency_id",
     )
-    def _compute_required_fields(self):
+    def _compute_tooltip_fields(self):
+        """Format the values shown in the tooltips of the rental timeline
+        view, which are only computed when a tooltip is displayed.
+        """
         lang = self.env["res.lang"].search(
             [("code", "=", self.env.user.company_id.partner_id.lang)]
         )
+        type_labels = self._get_type_labels(lang.code)
+        uom_hour = self.env.ref("uom.product_uom_hour")
+        date_format = lang.date_format
+        datetime_format = date_format + " " + lang.time_format
         for line in self:
             date_with_time = False
-            line.product_name = line.product_id.display_name
             line.product_categ_name = line.product_categ_id.display_name
-            try:
-                selections = self.with_context(lang=lang.code).fields_get()["type"][
-                    "selection"
-                ]
-                selection = [s for s in selections if s[0] == line.type][0]
-                line.type_formated = selection[1]
-            except Exception as e:
-                _logger.exception(e)
-                line.type_formated = str(line.type)
-
+            line.partner_shipping_address = False
+            line.rental_period = False
+            line.amount = False
+            if line.partner_shipping_id:
+                line.partner_shipping_address = line.partner_shipping_id.with_context(
+                    lang=lang.code
+                )._display_address()
+            if line.sale_line_id:
+                line.rental_period = "{product_uom_qty} {product_uom}".format(
+                    product_uom_qty=int(line.sale_line_id.product_uom_qty),
+                    product_uom=line.time_uom.with_context(lang=lang.code).name,
+                )
+            if line.currency_id:
+                line.amount = "{price_subtotal} {currency}".format(
+                    price_subtotal=lang.format(
+                        "%.2f", line.price_subtotal, grouping=True
+                    ),
+                    currency=line.currency_id.symbol,
+                )
+            line.type_formated = type_labels.get(line.type, str(line.type))
             if line.res_model == "sale.order.line":
-                if line.time_uom == self.env.ref("uom.product_uom_hour"):
+                if line.time_uom == uom_hour:
                     date_with_time = True
-            datetime_format = lang.date_format
-            if date_with_time:
-                datetime_format += " " + lang.time_format
+            line_format = datetime_format if date_with_time else date_format
             if isinstance(line.date_start, datetime):
-                line.date_start_formated = line.date_start.strftime(datetime_format)
+                line.date_start_formated = line.date_start.strftime(line_format)
             else:
                 line.date_start_formated = str(line.date_start)
             if isinstance(line.date_end, datetime):
-                line.date_end_formated = line.date_end.strftime(datetime_format)
+                line.date_end_formated = line.date_end.strftime(line_format)
             else:
                 line.date_end_formated = str(line.date_end)
 
-    @api.depends("product_id", "product_id.active")
+    @api.model
+    @tools.ormcache("lang_code")
+    def _get_type_labels(self, lang_code):
+        """Return the labels of the timeline types translated in the given
+        language, cached per language.
+        """
+        return dict(
+            self._fields["type"]._description_selection(
+                self.with_context(lang=lang_code).env
+            )
+        )
+
+    @api.depends("product_id", "product_id.active", "history")
     def _compute_active(self):
         for line in self:
             line.active = False
-            if line.product_id and line.product_id.active:
+            if line.product_id and line.product_id.active and not line.history:
                 line.active = True
+
+    @api.model
+    def _archive_history(self, months=HISTORY_MONTHS):
+        """Archive the timeline objects which ended more than the given
+        number of months ago, so that the searches of the rental timeline
+        view only go through the recent ones.
+
+        :return: number of timeline objects archived
+        """
+        self.env.cr.execute(
+            """
+            UPDATE product_timeline
+            SET history = TRUE, active = FALSE
+            WHERE date_end < (now() AT TIME ZONE 'UTC') - %s * interval '1 month'
+                AND history IS NOT TRUE
+            RETURNING id
+            """,
+            (months,),
+        )
+        timeline_ids = [timeline_id for timeline_id, in self.env.cr.fetchall()]
+        # not pushed to the clients, the archived objects are not shown by
+        # default and the ones showing the history reload on their next search
+        self.invalidate_cache(fnames=["history", "active"], ids=timeline_ids)
+        _logger.info("%s product timelines archived", len(timeline_ids))
+        return len(timeline_ids)
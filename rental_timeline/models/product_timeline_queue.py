@@ -0,0 +1,87 @@
+# Part of rental-vertical See LICENSE file for full copyright and licensing details.
+
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+
+class ProductTimelineQueue(models.Model):
+    _name = "product.timeline.queue"
+    _description = "Product Timelines to Recompute"
+    _log_access = False
+
+    res_model = fields.Char(
+        string="Origin Data Model",
+        required=True,
+    )
+
+    res_id = fields.Integer(
+        string="Origin Object ID",
+        required=True,
+    )
+
+    _sql_constraints = [
+        (
+            "res_uniq",
+            "UNIQUE(res_model, res_id)",
+            "An origin object can only be queued once.",
+        ),
+    ]
+
+    @api.model
+    def _enqueue(self, res_model, res_ids):
+        """Mark the timelines of the given origin objects to be recomputed
+        by the next flush of the queue.
+        """
+        if not res_ids:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO product_timeline_queue (res_model, res_id)
+            SELECT %s, unnest(%s::integer[])
+            ON CONFLICT (res_model, res_id) DO NOTHING
+            """,
+            (res_model, list(res_ids)),
+        )
+
+    @api.model
+    def _enqueue_domain_sql(self, where_clause, params):
+        """Mark the timelines matching a SQL condition on product_timeline
+        to be recomputed, without loading them.
+        """
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            """
+            INSERT INTO product_timeline_queue (res_model, res_id)
+            SELECT DISTINCT res_model, res_id
+            FROM product_timeline
+            WHERE res_model IS NOT NULL AND res_id IS NOT NULL AND ({})
+            ON CONFLICT (res_model, res_id) DO NOTHING
+            """.format(
+                where_clause
+            ),
+            params,
+        )
+
+    @api.model
+    def _flush(self, batch_size=1000):
+        """Recompute the timelines of the queued origin objects in batches.
+
+        Only the entries committed before the flush are processed, entries
+        added meanwhile wait for the next flush.
+        """
+        self.env.cr.execute(
+            "DELETE FROM product_timeline_queue RETURNING res_model, res_id"
+        )
+        res_ids_by_model = defaultdict(set)
+        for res_model, res_id in self.env.cr.fetchall():
+            res_ids_by_model[res_model].add(res_id)
+        # the archived history is updated as well
+        TimelineObj = self.env["product.timeline"].with_context(active_test=False)
+        for res_model, res_ids in res_ids_by_model.items():
+            for ids in split_every(batch_size, sorted(res_ids)):
+                TimelineObj.search(
+                    [("res_model", "=", res_model), ("res_id", "in", list(ids))]
+                )._recompute_fields()
+                TimelineObj.invalidate_cache()
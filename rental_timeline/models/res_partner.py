@@ -9,15 +9,10 @@ class ResPartner(models.Model):
     @api.multi
     def write(self, vals):
         res = super().write(vals)
-        address_fields = self._address_fields()
-        address_fields.append("name")
-        if any(field in vals for field in address_fields):
-            keys = set(self.env["product.timeline"]._get_partner_fields())
-            domain = [(field, "in", self.ids) for field in keys]
-            i = 1
-            while i < len(keys):
-                domain.insert(0, "|")
-                i += 1
-            timelines = self.env["product.timeline"].search(domain)
-            timelines._compute_fields()
+        if "name" in vals:
+            keys = sorted(self.env["product.timeline"]._get_partner_fields())
+            where_clause = " OR ".join('"%s" IN %%s' % field for field in keys)
+            self.env["product.timeline.queue"]._enqueue_domain_sql(
+                where_clause, [tuple(self.ids)] * len(keys)
+            )
         return res
@@ -1,8 +1,5 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 
-import functools
-import operator
-
 from odoo import _, api, exceptions, fields, models
 
 
@@ -12,7 +9,8 @@ class SaleOrderLine(models.Model):
     timeline_ids = fields.One2many(
         string="Timeline Objects",
         comodel_name="product.timeline",
-        compute="_compute_timeline_ids",
+        inverse_name="sale_line_id",
+        context={"active_test": False},
     )
 
     rental_type = fields.Selection(
@@ -23,15 +21,6 @@ class SaleOrderLine(models.Model):
         }
     )
 
-    @api.multi
-    def _compute_timeline_ids(self):
-        for line in self:
-            domain = [
-                ("res_model", "=", line._name),
-                ("res_id", "=", line.id),
-            ]
-            line.timeline_ids = self.env["product.timeline"].search(domain)
-
     @api.multi
     def _prepare_timeline_vals(self):
         self.ensure_one()
@@ -43,17 +32,26 @@ class SaleOrderLine(models.Model):
             "order_name": self.order_id.name,
             "res_model": self._name,
             "res_id": self.id,
+            "sale_line_id": self.id,
             "click_res_model": self.order_id._name,
             "click_res_id": self.order_id.id,
         }
 
+    @api.multi
+    def _get_timeline_lines(self):
+        """Return the lines renting out a product, which have timeline objects."""
+        return self.filtered(
+            lambda l: l.product_id.rented_product_id
+            and l.rental_type in ["new_rental", "rental_extension"]
+        )
+
     @api.multi
     def _create_product_timeline(self):
-        self.ensure_one()
-        if self.product_id.rented_product_id:
-            if self.rental_type in ["new_rental", "rental_extension"]:
-                vals = self._prepare_timeline_vals()
-                self.env["product.timeline"].create(vals)
+        """Create the timeline objects of all the lines at once."""
+        vals_list = [
+            line._prepare_timeline_vals() for line in self._get_timeline_lines()
+        ]
+        return self.env["product.timeline"].create(vals_list)
 
     @api.multi
     def _reset_timeline(self, vals):
@@ -101,14 +99,18 @@ class SaleOrderLine(models.Model):
                     % (line.id, line.order_id.name)
                 )
 
+    @api.multi
+    def _get_timelines(self):
+        """Return the timeline objects of all the lines."""
+        return self.mapped("timeline_ids")
+
     @api.multi
     def _timeline_recompute_fields(self):
-        for line in self:
-            line.timeline_ids._compute_fields()
+        self._get_timelines()._recompute_fields()
 
-    @api.model
-    def create(self, vals):
-        res = super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super().create(vals_list)
         res._create_product_timeline()
         return res
 
@@ -119,18 +121,14 @@ class SaleOrderLine(models.Model):
         if keys.intersection(vals.keys()):
             rental = vals.get("rental", False)
             reset_lines = self.browse([])
+            new_timeline_lines = self.browse([])
             start_date = vals.get("start_date", False)
             end_Date = vals.get("end_date", False)
             product_id = vals.get("product_id", False)
             name = vals.get("name", False)
             for line in self:
-                if rental:
-                    search = [
-                        ("res_model", "=", self._name),
-                        ("res_id", "=", self.id),
-                    ]
-                    if not self.env["product.timeline"].search(search):
-                        line._create_product_timeline()
+                if rental and not line.timeline_ids:
+                    new_timeline_lines |= line
                 if start_date and line.start_date != start_date:
                     reset_lines |= line
                 if end_Date and line.end_date != end_Date:
@@ -155,6 +153,7 @@ class SaleOrderLine(models.Model):
                         )
                         % (line.order_id.name, line.product_id.display_name)
                     )
+            new_timeline_lines._create_product_timeline()
             reset_lines._reset_timeline(vals)
         keys = set(self.env["product.timeline"]._get_depends_fields("sale.order.line"))
         if keys.intersection(vals.keys()):
@@ -163,13 +162,8 @@ class SaleOrderLine(models.Model):
 
     @api.multi
     def unlink(self):
-        res = super(SaleOrderLine, self).unlink()
-        domain = [
-            ("res_model", "=", self._name),
-            ("res_id", "in", self.ids),
-        ]
-        self.env["product.timeline"].search(domain).unlink()
-        return res
+        self.mapped("timeline_ids").unlink()
+        return super(SaleOrderLine, self).unlink()
 
     @api.multi
     def update_start_end_date(self, date_start, date_end):
@@ -192,9 +186,9 @@ class SaleOrder(models.Model):
         res = super().write(vals)
         keys = {"partner_id", "partner_shipping_id", "name"}
         if keys.intersection(vals.keys()):
-            for order in self:
-                for line in order.order_line:
-                    line._timeline_recompute_fields()
+            self.env["product.timeline.queue"]._enqueue(
+                "sale.order.line", self.mapped("order_line").ids
+            )
         return res
 
     @api.multi
@@ -202,12 +196,7 @@ class SaleOrder(models.Model):
         """
         Delete all timeline objects when cancelling sale order.
         """
-        for order in self:
-            for line in order.order_line.filtered(
-                lambda l: l.rental_type == "rental_extension"
-                or l.rental_type == "new_rental"
-            ):
-                line.timeline_ids.unlink()
+        self.mapped("order_line")._get_timeline_lines()._get_timelines().unlink()
         res = super(SaleOrder, self).action_cancel()
         return res
 
@@ -217,9 +206,7 @@ class SaleOrder(models.Model):
         Recreate the timeline objects when setting sale order to draft state.
         """
         res = super(SaleOrder, self).action_draft()
-        for order in self:
-            for line in order.order_line:
-                line._create_product_timeline()
+        self.mapped("order_line")._create_product_timeline()
         return res
 
     @api.multi
@@ -230,23 +217,19 @@ class SaleOrder(models.Model):
         values = {
             "type": "rental",
         }
-        for order in self:
-            for line in order.order_line.filtered(
-                lambda l: l.rental_type == "rental_extension"
-                or l.rental_type == "new_rental"
-            ):
-                line.timeline_ids.write(values)
-                line.timeline_ids._compute_fields()
+        timelines = self.mapped("order_line")._get_timeline_lines()._get_timelines()
+        timelines.write(values)
+        timelines._recompute_fields()
         res = super(SaleOrder, self).action_confirm()
         return res
 
+    @api.multi
+    def action_rebuild_timeline(self):
+        """Recreate the timeline objects of the rental order lines."""
+        self.env["product.timeline"]._rebuild_sale_line_timelines(self.ids)
+        return True
+
     @api.multi
     def unlink(self):
-        ids = functools.reduce(operator.iconcat, [i.order_line.ids for i in self], [])
-        if ids:
-            domain = [
-                ("res_model", "=", "sale.order.line"),
-                ("res_id", "in", ids),
-            ]
-            self.env["product.timeline"].search(domain).unlink()
+        self.mapped("order_line.timeline_ids").unlink()
         return super(SaleOrder, self).unlink()
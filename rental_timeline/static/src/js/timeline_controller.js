@@ -2,14 +2,195 @@ odoo.define("rental_timeline.RentalTimelineController", function(require) {
     "use strict";
 
     var dialogs = require("web.view_dialogs");
+    var time = require("web.time");
 
     var _TimelineController = require("web_timeline.TimelineController");
 
+    var TIMELINE_CHANNEL = "rental_timeline.product_timeline";
+
     var RentalTimelineController = _TimelineController.extend({
         custom_events: _.extend({}, _TimelineController.prototype.custom_events, {
             onGroupDoubleClick: "_onGroupDoubleClick",
+            onRangeChanged: "_onRangeChanged",
+            onUtilizationChanged: "_onUtilizationChanged",
         }),
 
+        start: function() {
+            this.call("bus_service", "addChannel", TIMELINE_CHANNEL);
+            this.call("bus_service", "onNotification", this, this._onNotification);
+            this.call("bus_service", "startPolling");
+            return this._super.apply(this, arguments);
+        },
+
+        destroy: function() {
+            this.call("bus_service", "deleteChannel", TIMELINE_CHANNEL);
+            this._super.apply(this, arguments);
+        },
+
+        /**
+         * Give the renderer the domain and window of the events to load, so
+         * that it groups the same events on the server.
+         *
+         * @param {Object} params
+         * @returns {jQuery.Deferred}
+         */
+        update: function(params) {
+            if (params && params.domain) {
+                var window_params = this.model.windowParams({
+                    model: this.modelName,
+                    method: "search_read",
+                    domain: params.domain,
+                }).kwargs;
+                this.renderer.window_params = _.pick(
+                    window_params,
+                    "domain",
+                    "date_start",
+                    "date_end"
+                );
+            }
+            return this._super.apply(this, arguments);
+        },
+
+        _rpc: function(params, options) {
+            return this._super(this.model.windowParams(params), options);
+        },
+
+        /**
+         * Load the items of the new visible window when it leaves the
+         * loaded period.
+         *
+         * @param {OdooEvent} event
+         * @private
+         */
+        _onRangeChanged: function(event) {
+            if (this.model.isWindowLoaded(event.data.start, event.data.end)) {
+                return;
+            }
+            this.model.setVisibleWindow(event.data.start, event.data.end);
+            this._reload();
+        },
+
+        /**
+         * Reload the items of the loaded period.
+         *
+         * @private
+         * @returns {jQuery.Deferred}
+         */
+        _reload: function() {
+            return this.update(
+                {
+                    domain: this.last_domains,
+                    context: this.last_contexts,
+                    groupBy: this.renderer.last_group_bys,
+                },
+                {
+                    adjust_window: false,
+                    reload: false,
+                }
+            );
+        },
+
+        /**
+         * Apply the changes of the timeline objects committed by other
+         * transactions, only reading the created and updated items matching
+         * the current search.
+         *
+         * @param {Array[]} notifications
+         * @private
+         * @returns {jQuery.Deferred}
+         */
+        _onNotification: function(notifications) {
+            var self = this;
+            if (!this.renderer.timeline) {
+                return $.when();
+            }
+            var fields = _.uniq(
+                this.renderer.fieldNames.concat(this.renderer.last_group_bys)
+            );
+            var changed_ids = [];
+            var removed_ids = [];
+            var reload = false;
+            _.each(notifications, function(notification) {
+                if (notification[0] !== TIMELINE_CHANNEL) {
+                    return;
+                }
+                var message = notification[1];
+                // Too many changes to read them one by one
+                if (message.reload) {
+                    reload = true;
+                    return;
+                }
+                changed_ids = changed_ids.concat(message.created);
+                // Updates of fields which are not displayed are ignored
+                if (_.intersection(message.fields, fields).length) {
+                    changed_ids = changed_ids.concat(message.updated);
+                }
+                removed_ids = removed_ids.concat(message.deleted);
+            });
+            if (!reload && !changed_ids.length && !removed_ids.length) {
+                return $.when();
+            }
+            if (this.renderer.utilization_interval) {
+                return this._onUtilizationChanged();
+            }
+            if (reload) {
+                return this._reload();
+            }
+            return this._rpc({
+                model: this.modelName,
+                method: "search_read",
+                kwargs: {
+                    domain: (this.last_domains || []).concat([
+                        ["id", "in", changed_ids],
+                    ]),
+                    fields: fields,
+                },
+                context: this.getSession().user_context,
+            }).then(function(events) {
+                // Changed items which do not match the search anymore
+                var removed = _.difference(changed_ids, _.pluck(events, "id"));
+                if (!self.renderer.apply_changes(events, removed_ids.concat(removed))) {
+                    return self._reload();
+                }
+            });
+        },
+
+        /**
+         * Load the utilization buckets of the visible window, or reload its
+         * items when the utilization mode is left.
+         *
+         * @private
+         * @returns {jQuery.Deferred}
+         */
+        _onUtilizationChanged: function() {
+            var self = this;
+            var group_by = _.first(this.renderer.last_group_bys);
+            var range = this.renderer.timeline.getWindow();
+            if (!this.renderer.utilization_interval) {
+                this.model.setVisibleWindow(range.start, range.end);
+                return this._reload();
+            }
+            return this._rpc({
+                model: this.modelName,
+                method: "get_utilization_buckets",
+                args: [
+                    this.last_domains || [],
+                    time.date_to_str(range.start),
+                    time.date_to_str(range.end),
+                ],
+                kwargs: {
+                    group_by:
+                        group_by === "product_categ_id"
+                            ? "product_categ_id"
+                            : "product_id",
+                    interval: this.renderer.utilization_interval,
+                },
+                context: this.getSession().user_context,
+            }).then(function(utilization) {
+                self.renderer.on_utilization_loaded(utilization);
+            });
+        },
+
         _onGroupClick: function(event) {
             var groupField = this.renderer.grouped_by;
 
@@ -0,0 +1,82 @@
+odoo.define("rental_timeline.RentalTimelineModel", function(require) {
+    "use strict";
+
+    var TimelineModel = require("web_timeline.TimelineModel");
+    var time = require("web.time");
+
+    var RentalTimelineModel = TimelineModel.extend({
+        /**
+         * Length of the period loaded on each side of the visible window,
+         * as a factor of the length of the visible window.
+         */
+        window_margin: 1,
+
+        init: function() {
+            this._super.apply(this, arguments);
+            var now = moment();
+            this.setVisibleWindow(
+                moment(now).subtract(15, "days"),
+                moment(now).add(15, "days")
+            );
+        },
+
+        /**
+         * Set the period to load from the visible window of the timeline.
+         *
+         * @param {Date} start
+         * @param {Date} end
+         */
+        setVisibleWindow: function(start, end) {
+            var margin = moment(end).diff(start) * this.window_margin;
+            this.load_window = {
+                start: moment(start).subtract(margin, "ms"),
+                end: moment(end).add(margin, "ms"),
+            };
+        },
+
+        /**
+         * Check whether the items of the visible window are already loaded.
+         *
+         * @param {Date} start
+         * @param {Date} end
+         * @returns {Boolean}
+         */
+        isWindowLoaded: function(start, end) {
+            return (
+                !moment(start).isBefore(this.load_window.start) &&
+                !moment(end).isAfter(this.load_window.end)
+            );
+        },
+
+        /**
+         * Replace a search_read on the timeline items by a read of the items
+         * of the loaded period.
+         *
+         * @param {Object} params
+         * @returns {Object}
+         */
+        windowParams: function(params) {
+            if (params.model !== this.modelName || params.method !== "search_read") {
+                return params;
+            }
+            var kwargs = params.kwargs || {};
+            return {
+                model: params.model,
+                method: "search_read_window",
+                context: params.context,
+                kwargs: _.extend({}, kwargs, {
+                    domain: params.domain || kwargs.domain || [],
+                    fields: params.fields || kwargs.fields,
+                    date_start: time.datetime_to_str(this.load_window.start.toDate()),
+                    date_end: time.datetime_to_str(this.load_window.end.toDate()),
+                }),
+            };
+        },
+
+        _rpc: function(params, options) {
+            return this._super(this.windowParams(params), options);
+        },
+    });
+
+    return RentalTimelineModel;
+});
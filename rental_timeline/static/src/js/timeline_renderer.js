@@ -7,303 +7,66 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
 
     var time = require("web.time");
 
-    var is_default_product_id = true;
-    var group_categ_again = 0;
-
     var RentalTimelineRenderer = _TimelineRenderer.extend({
+        events: _.extend({}, _TimelineRenderer.prototype.events, {
+            "change .oe_timeline_select_utilization": "_onUtilizationChanged",
+        }),
+
+        /**
+         * Interval of the utilization buckets displayed instead of the items,
+         * false to display the items.
+         */
+        utilization_interval: false,
+
+        /**
+         * Domain and window of the loaded events, set by the controller.
+         */
+        window_params: {},
+
         /**
-         * Get the groups.
+         * Load the group tree of the events before displaying them, grouping
+         * the events of the loaded domain and window on the server.
          *
          * @param {Object[]} events
          * @param {String[]} group_bys
          * @private
-         * @returns {Array}
+         * @returns {jQuery.Deferred}
          */
-        split_groups: function(events, group_bys) {
-            if (group_bys.length === 0) {
-                return events;
-            }
-
-            var groups = [];
+        on_data_loaded: function(events, group_bys) {
             var self = this;
-            // Groups.push({id: -1, content: _t('-')});
-
-            _.each(events, function(event) {
-                var product_group_name = event[_.first(["product_id"])];
-                if (product_group_name) {
-                    if (product_group_name instanceof Array) {
-                        let group = _.find(groups, function(existing_group) {
-                            return _.isEqual(existing_group.id, product_group_name[0]);
-                        });
-
-                        if (_.isUndefined(group)) {
-                            var tooltip = null;
-                            if (self.qweb.has_template("tooltip-item-group")) {
-                                tooltip = self.qweb.render("tooltip-item-group", {
-                                    record: event,
-                                });
-                            }
-                            if (product_group_name[1].slice(0, 3) !== "All") {
-                                group = {
-                                    id: product_group_name[0],
-                                    content: product_group_name[1],
-                                    tooltip: tooltip,
-                                    partner_id: event.partner_id,
-                                    order_name: event.order_name,
-                                    product_id: event.product_id,
-                                };
-                                groups.push(group);
-                            }
-                        }
-                    }
-                }
+            var args = arguments;
+            var _super = this._super;
+            return this._rpc({
+                model: this.modelName,
+                method: "get_timeline_groups",
+                kwargs: _.extend({}, this.window_params, {
+                    group_by: _.first(group_bys) || false,
+                }),
+                context: this.getSession().user_context,
+            }).then(function(group_tree) {
+                self.group_tree = group_tree;
+                return _super.apply(self, args);
             });
-
-            if (!is_default_product_id) {
-                if (group_bys[0] === "product_categ_id") {
-                    var group_categs = [];
-
-                    _.each(events, function(event) {
-                        var group_name = event[_.first(group_bys)];
-
-                        if (group_name) {
-                            if (group_name instanceof Array) {
-                                let group = _.find(group_categs, function(
-                                    existing_group
-                                ) {
-                                    return _.isEqual(
-                                        existing_group.content,
-                                        group_name[1]
-                                    );
-                                });
-
-                                if (_.isUndefined(group)) {
-                                    var tooltip = null;
-                                    if (self.qweb.has_template("tooltip-item-group")) {
-                                        tooltip = self.qweb.render(
-                                            "tooltip-item-group",
-                                            {
-                                                record: event,
-                                            }
-                                        );
-                                    }
-
-                                    const nested_groups = [];
-                                    _.each(events, function(event_p) {
-                                        if (
-                                            event_p.product_categ_name ===
-                                            event.product_categ_name
-                                        ) {
-                                            if (
-                                                !nested_groups.includes(
-                                                    event_p.product_id[0]
-                                                )
-                                            ) {
-                                                nested_groups.push(
-                                                    event_p.product_id[0]
-                                                );
-                                            }
-                                            console.log(
-                                                `event_p.product_categ_name ${event_p.product_categ_name}`
-                                            );
-                                        }
-                                    });
-
-                                    group = {
-                                        id: group_name[0] + 1000000,
-                                        // Id: 100000 + counter,
-                                        content: group_name[1],
-                                        nestedGroups: nested_groups,
-                                        tooltip: tooltip,
-                                    };
-
-                                    group_categs.push(group);
-                                }
-                            }
-                        }
-                    });
-                    groups = groups.concat(group_categs);
-                } else if (group_bys[0] === "order_name") {
-                    var group_order_names = [];
-
-                    _.each(events, function(event) {
-                        var group_name = event[_.first(group_bys)];
-                        if (group_name) {
-                            if (group_name) {
-                                let group = _.find(group_order_names, function(
-                                    existing_group
-                                ) {
-                                    return _.isEqual(
-                                        existing_group.content,
-                                        group_name
-                                    );
-                                });
-                                if (_.isUndefined(group)) {
-                                    var tooltip = null;
-                                    if (self.qweb.has_template("tooltip-item-group")) {
-                                        tooltip = self.qweb.render(
-                                            "tooltip-item-group",
-                                            {
-                                                record: event,
-                                            }
-                                        );
-                                    }
-                                    const nested_groups = [];
-                                    _.each(events, function(event_o) {
-                                        if (event_o.order_name === event.order_name) {
-                                            if (
-                                                !nested_groups.includes(
-                                                    event_o.product_id[0]
-                                                )
-                                            ) {
-                                                nested_groups.push(
-                                                    event_o.product_id[0]
-                                                );
-                                            }
-                                        }
-                                    });
-                                    group = {
-                                        id: event.id + 1000000,
-                                        content: group_name,
-                                        nestedGroups: nested_groups,
-                                        tooltip: tooltip,
-                                        order_name: group_name,
-                                    };
-                                    group_order_names.push(group);
-                                }
-                            }
-                        }
-                    });
-
-                    const groups_and_layersGroup = self.generate_sub_groups(
-                        groups,
-                        group_order_names,
-                        "order_name"
-                    );
-                    groups = groups_and_layersGroup[0];
-                    group_order_names = groups_and_layersGroup[1];
-
-                    groups = groups.concat(group_order_names);
-                } else if (group_bys[0] === "partner_id") {
-                    var group_partners = [];
-
-                    _.each(events, function(event) {
-                        var group_name = event[_.first(group_bys)];
-                        if (group_name) {
-                            if (group_name instanceof Array) {
-                                let group = _.find(group_partners, function(
-                                    existing_group
-                                ) {
-                                    return _.isEqual(
-                                        existing_group.content,
-                                        group_name[1]
-                                    );
-                                });
-
-                                if (_.isUndefined(group)) {
-                                    var tooltip = null;
-                                    if (self.qweb.has_template("tooltip-item-group")) {
-                                        tooltip = self.qweb.render(
-                                            "tooltip-item-group",
-                                            {
-                                                record: event,
-                                            }
-                                        );
-                                    }
-
-                                    const nested_groups = [];
-                                    _.each(events, function(event_p) {
-                                        if (
-                                            event_p.partner_id[1] ===
-                                            event.partner_id[1]
-                                        ) {
-                                            if (
-                                                !nested_groups.includes(
-                                                    event_p.product_id[0]
-                                                )
-                                            ) {
-                                                nested_groups.push(
-                                                    event_p.product_id[0]
-                                                );
-                                            }
-                                        }
-                                    });
-
-                                    group = {
-                                        id: group_name[0] + 1000000,
-                                        content: group_name[1],
-                                        nestedGroups: nested_groups,
-                                        tooltip: tooltip,
-                                        partner_id: group_name,
-                                    };
-
-                                    group_partners.push(group);
-                                }
-                            }
-                        }
-                    });
-
-                    const groups_and_layersGroup = self.generate_sub_groups(
-                        groups,
-                        group_partners,
-                        "partner_id"
-                    );
-                    groups = groups_and_layersGroup[0];
-                    group_partners = groups_and_layersGroup[1];
-
-                    groups = groups.concat(group_partners);
-                }
-            }
-
-            is_default_product_id = true;
-            return groups;
         },
 
         /**
-         * Generate new sub group if the old sub groups have the same group ID.
+         * Get the groups from the group tree computed by the server.
          *
-         * @param {String[]} groups
-         * @param {String[]} layer_groups
-         * @param {String} group_by
          * @private
-         * @returns {[groups, layer_groups]}
+         * @returns {Array}
          */
-        generate_sub_groups: function(groups, layer_groups, group_by) {
-            var ids = groups.map(group => {
-                return group.id;
-            });
-            var max_id = Math.max(...ids);
-
-            for (let i = 0; i < layer_groups.length - 1; i++) {
-                for (let k = 0; k < layer_groups[i].nestedGroups.length; k++) {
-                    for (let j = i + 1; j < layer_groups.length; j++) {
-                        for (let m = 0; m < layer_groups[j].nestedGroups.length; m++) {
-                            if (
-                                layer_groups[i].nestedGroups[k] ===
-                                layer_groups[j].nestedGroups[m]
-                            ) {
-                                const group = groups.find(
-                                    elem => elem.id === layer_groups[j].nestedGroups[m]
-                                );
-                                const newGroup = Object.assign({}, group);
-                                newGroup.original_id = newGroup.id;
-
-                                max_id++;
-                                newGroup.id = max_id;
-                                if (group_by === "partner_id") {
-                                    newGroup.partner_id = layer_groups[j].partner_id;
-                                } else if (group_by === "order_name") {
-                                    newGroup.order_name = layer_groups[j].order_name;
-                                }
-                                groups.push(newGroup);
-                                layer_groups[j].nestedGroups[m] = newGroup.id;
-                            }
-                        }
-                    }
+        get_groups: function() {
+            var self = this;
+            var has_tooltip = this.qweb.has_template("tooltip-item-group");
+            return _.map(this.group_tree.groups, function(group) {
+                var tooltip = null;
+                if (has_tooltip && group.tooltip_record) {
+                    tooltip = self.qweb.render("tooltip-item-group", {
+                        record: group.tooltip_record,
+                    });
                 }
-            }
-
-            return [groups, layer_groups];
+                return _.extend(_.omit(group, "tooltip_record"), {tooltip: tooltip});
+            });
         },
 
         /**
@@ -409,7 +172,6 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
         init_timeline: function() {
             var self = this;
             var util = vis.util;
-            is_default_product_id = false;
 
             this._super();
             this.options.editable = {
@@ -429,6 +191,22 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
             // This.timeline.on('click', self.on_parent_group_click)
 
             this.timeline.on("doubleClick", self.on_group_double_click);
+            this.timeline.on("mouseOver", function(props) {
+                self.on_item_mouse_over(props);
+            });
+            this.$el.on("mouseleave", function() {
+                self.hide_item_tooltip();
+            });
+            this.timeline.on("rangechanged", function(props) {
+                if (self.utilization_interval) {
+                    self.trigger_up("onUtilizationChanged");
+                    return;
+                }
+                self.trigger_up("onRangeChanged", {
+                    start: props.start,
+                    end: props.end,
+                });
+            });
             // This.timeline.on('click', self.on_group_click);
             this.timeline.on("click", function(props) {
                 props.event.preventDefault();
@@ -553,6 +331,79 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
             })(vis.timeline.components.items.Item.prototype._repaintDragCenter);
         },
 
+        /**
+         * Show the tooltip of the hovered item, loading its values from the
+         * server the first time.
+         *
+         * @param {Object} props event properties of the timeline
+         * @private
+         */
+        on_item_mouse_over: function(props) {
+            var self = this;
+            var res_id = parseInt(props.item, 10);
+            if (!res_id || !this.qweb.has_template("tooltip-item")) {
+                this.hide_item_tooltip();
+                return;
+            }
+            if (!this.item_popup) {
+                this.item_popup = new Popup(this.timeline.body.dom.root, "flip");
+            }
+            var container = this.timeline.body.dom.centerContainer;
+            this.item_popup.setPosition(
+                props.event.clientX -
+                    vis.util.getAbsoluteLeft(container) +
+                    container.offsetLeft,
+                props.event.clientY -
+                    vis.util.getAbsoluteTop(container) +
+                    container.offsetTop
+            );
+            if (this.tooltip_item === res_id) {
+                this.item_popup.show();
+                return;
+            }
+            this.tooltip_item = res_id;
+            this.item_popup.hide();
+            this.get_item_tooltip(res_id).then(function(tooltip) {
+                if (self.tooltip_item === res_id) {
+                    self.item_popup.setText(tooltip);
+                    self.item_popup.show();
+                }
+            });
+        },
+
+        /**
+         * Get the rendered tooltip of an item, cached until the items are
+         * loaded or changed again.
+         *
+         * @param {Integer} res_id
+         * @private
+         * @returns {jQuery.Deferred}
+         */
+        get_item_tooltip: function(res_id) {
+            var self = this;
+            if (!this.item_tooltips) {
+                this.item_tooltips = {};
+            }
+            if (!this.item_tooltips[res_id]) {
+                this.item_tooltips[res_id] = this._rpc({
+                    model: this.modelName,
+                    method: "get_tooltip_values",
+                    args: [[res_id]],
+                    context: this.getSession().user_context,
+                }).then(function(values) {
+                    return self.qweb.render("tooltip-item", {record: values});
+                });
+            }
+            return this.item_tooltips[res_id];
+        },
+
+        hide_item_tooltip: function() {
+            this.tooltip_item = null;
+            if (this.item_popup) {
+                this.item_popup.hide();
+            }
+        },
+
         /**
          * Handle double click on a group header.
          *
@@ -581,21 +432,14 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
          * @private
          */
         on_data_loaded_2: function(events, group_bys, x2x, adjust_window) {
+            if (this.utilization_interval) {
+                this.trigger_up("onUtilizationChanged");
+                return;
+            }
             var self = this;
             var data = [];
             var groups = [];
 
-            if (group_bys[0] === "product_categ_id" && group_categ_again % 2 === 0) {
-                is_default_product_id = false;
-                group_categ_again += 2;
-            } else if (group_bys[0] === "order_name" && group_categ_again % 2 === 0) {
-                is_default_product_id = false;
-                group_categ_again += 2;
-            } else if (group_bys[0] === "partner_id" && group_categ_again % 2 === 0) {
-                is_default_product_id = false;
-                group_categ_again += 2;
-            }
-
             if (
                 group_bys[0] !== "product_categ_id" &&
                 group_bys[0] !== "order_name" &&
@@ -620,8 +464,6 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
                         }
                     }
                 });
-
-                group_categ_again++;
             } else {
                 this.grouped_by = "product_id";
                 _.each(events, function(event) {
@@ -641,73 +483,20 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
                         }
                     }
                 });
-
-                group_categ_again++;
             }
 
             if (typeof this.$select_groups !== "undefined") {
                 this.$(".selected-groups").html("");
                 this.$select_groups.remove();
             }
-            groups = this.split_groups(events, group_bys);
-
-            if (group_bys[0] === "partner_id") {
-                for (let i = 0; i < groups.length; i++) {
-                    data.forEach(item => {
-                        if (!("nestedGroups" in groups[i])) {
-                            // If(item.group === groups[i].id && !_.isEqual(item.evt.partner_id, groups[i].partner_id)){
-                            //     if(i +1 < groups.length) {
-                            //         for(let j = i +1 ; j < groups.length; j ++) {
-                            //             if(!('nestedGroups' in groups[j])) {
-                            //                 if(_.isEqual(item.evt.product_id, groups[j].product_id)){
-                            //                     if(_.isEqual(item.evt.partner_id, groups[j].partner_id)) {
-                            //                         item.original_group = item.group
-                            //                         item.group = groups[j].id
-                            //                     }
-                            //                 }
-                            //             }
-                            //         }
-                            //     }
-                            // } else
-                            if (
-                                item.group !== groups[i].id &&
-                                _.isEqual(item.evt.product_id, groups[i].product_id) &&
-                                _.isEqual(item.evt.partner_id, groups[i].partner_id)
-                            ) {
-                                item.group = groups[i].id;
-                            }
-                        }
-                    });
-                }
-            }
+            groups = this.get_groups();
 
-            if (group_bys[0] === "order_name") {
-                for (let i = 0; i < groups.length; i++) {
-                    data.forEach(item => {
-                        if (!("nestedGroups" in groups[i])) {
-                            // If(item.group === groups[i].id && item.evt.order_name !== groups[i].order_name){
-                            //     if(i +1 < groups.length) {
-                            //         for(let j = i +1 ; j < groups.length; j ++) {
-                            //             if( item.evt.order_name === groups[j].order_name && _.isEqual(item.evt.product_id, groups[j].product_id)){
-                            //                 item.original_group = item.group
-                            //                 item.group = groups[j].id
-                            //             }
-                            //         }
-                            //     }
-                            // } else
-                            if (
-                                item.group !== groups[i].id &&
-                                _.isEqual(item.evt.product_id, groups[i].product_id) &&
-                                item.evt.order_name === groups[i].order_name
-                            ) {
-                                item.group = groups[i].id;
-                            }
-                        }
-                    });
-                }
-            }
+            _.each(data, function(item) {
+                self.set_item_group(item);
+            });
 
             groups = new vis.DataSet(groups);
+            this.item_tooltips = {};
             this.timeline.setGroups(groups);
             this.timeline.setItems(data);
             var mode = !this.mode || this.mode === "fit";
@@ -717,6 +506,94 @@ odoo.define("rental_timeline.RentalTimelineRenderer", function(require) {
             }
         },
 
+        /**
+         * Put an item in the group of its product under its parent group
+         * when the products are grouped by partner or order.
+         *
+         * @param {Object} item
+         * @private
+         * @returns {Boolean} whether the group of the item is known
+         */
+        set_item_group: function(item) {
+            var parent_field = _.first(this.last_group_bys);
+            if (parent_field !== "partner_id" && parent_field !== "order_name") {
+                return true;
+            }
+            var parent = item.evt[parent_field];
+            if (parent instanceof Array) {
+                parent = parent[0];
+            }
+            var group = this.group_tree.item_groups[
+                item.evt.product_id[0] + "," + parent
+            ];
+            if (_.isUndefined(group)) {
+                return false;
+            }
+            item.group = group;
+            return true;
+        },
+
+        /**
+         * Apply the changes of some events to the displayed items.
+         *
+         * @param {Object[]} events created or updated events
+         * @param {Integer[]} removed_ids ids of the events to remove
+         * @private
+         * @returns {Boolean} false if an event belongs to a group which is
+         *      not displayed, in which case nothing is applied
+         */
+        apply_changes: function(events, removed_ids) {
+            var self = this;
+            var groups = this.timeline.groupsData;
+            var items = _.map(events, function(event) {
+                return self.event_data_transform(event);
+            });
+            var known_groups = _.every(items, function(item) {
+                return self.set_item_group(item) && groups.get(item.group) !== null;
+            });
+            if (!known_groups) {
+                return false;
+            }
+            this.item_tooltips = _.omit(
+                this.item_tooltips,
+                _.pluck(events, "id").concat(removed_ids)
+            );
+            this.timeline.itemsData.remove(removed_ids);
+            this.timeline.itemsData.update(items);
+            return true;
+        },
+
+        /**
+         * Display the utilization buckets computed by the server, one item
+         * per group and bucket shaded by its utilization.
+         *
+         * @param {Object} utilization
+         * @private
+         */
+        on_utilization_loaded: function(utilization) {
+            var items = _.map(utilization.buckets, function(bucket, index) {
+                var percent = Math.round(bucket.utilization * 100);
+                var alpha = 0.1 + 0.9 * Math.min(bucket.utilization, 1);
+                return {
+                    id: "utilization_" + index,
+                    group: bucket.group,
+                    start: moment(bucket.start).toDate(),
+                    end: moment(bucket.end).toDate(),
+                    content: percent + "%",
+                    title: percent + "% (" + bucket.items + ")",
+                    className: "oe_timeline_utilization",
+                    style: "background-color: rgba(124, 123, 173, " + alpha + ");",
+                };
+            });
+            this.timeline.setGroups(new vis.DataSet(utilization.groups));
+            this.timeline.setItems(items);
+        },
+
+        _onUtilizationChanged: function(event) {
+            this.utilization_interval = $(event.currentTarget).val() || false;
+            this.trigger_up("onUtilizationChanged");
+        },
+
         _do_nothing: function() {
             console.log("click event is fired");
         },
@@ -3,7 +3,7 @@ odoo.define("rental_timeline.RentalTimelineView", function(require) {
 
     var core = require("web.core");
     var view_registry = require("web.view_registry");
-    var TimelineModel = require("web_timeline.TimelineModel");
+    var RentalTimelineModel = require("rental_timeline.RentalTimelineModel");
     var _TimelineView = require("web_timeline.TimelineView");
     var RentalTimelineRenderer = require("rental_timeline.RentalTimelineRenderer");
     var RentalTimelineController = require("rental_timeline.RentalTimelineController");
@@ -12,7 +12,7 @@ odoo.define("rental_timeline.RentalTimelineView", function(require) {
     var RentalTimelineView = _TimelineView.extend({
         display_name: _lt("Rental Timeline"),
         config: {
-            Model: TimelineModel,
+            Model: RentalTimelineModel,
             Controller: RentalTimelineController,
             Renderer: RentalTimelineRenderer,
         },
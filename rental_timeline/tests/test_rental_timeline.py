@@ -1,8 +1,15 @@
 # Part of rental-vertical See LICENSE file for full copyright and licensing details.
 
+from dateutil.relativedelta import relativedelta
+
 from odoo import fields
 
 from odoo.addons.rental_base.tests.stock_common import RentalStockCommon
+from odoo.addons.rental_timeline.controllers.main import _ical_chunks
+from odoo.addons.rental_timeline.models.product_timeline import (
+    TIMELINE_CHANGES,
+    TIMELINE_MAX_CHANGES,
+)
 
 
 class TestRentalTimeline(RentalStockCommon):
@@ -68,6 +75,8 @@ class TestRentalTimeline(RentalStockCommon):
         # get related timeline object
         timeline = self.get_related_timeline_from_rental_order(line)
         self.assertEqual(len(timeline), 1)
+        self.assertEqual(line.timeline_ids, timeline)
+        self.assertEqual(timeline.sale_line_id, line)
         self.assertEqual(timeline.partner_id.name, self.partnerA.name)
         # update Partner A name
         self.partnerA.name = "Timeline Partner A Update"
@@ -159,3 +168,316 @@ class TestRentalTimeline(RentalStockCommon):
         # get related timeline object after set to draft the order
         timeline = self.get_related_timeline_from_rental_order(line)
         self.assertTrue(timeline)
+
+    def test_03_recompute_timelines_in_batch(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_1)
+        # rental orders
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_2 = self._create_rental_order(
+            self.partnerA.id, self.date_0102, self.date_0111, qty=2
+        )
+        (rental_order_1 | rental_order_2).action_confirm()
+        lines = (rental_order_1 | rental_order_2).mapped("order_line")
+        timelines = lines._get_timelines()
+        self.assertEqual(len(timelines), 2)
+        self.assertEqual(set(timelines.mapped("type")), {"rental"})
+        self.assertEqual(set(timelines.mapped("type_formated")), {"Confirmed Order"})
+        # the address of the tooltips is not stored
+        self.partnerA.street = "Timeline Street 1"
+        for timeline in timelines:
+            self.assertIn("Timeline Street 1", timeline.partner_shipping_address)
+        self.assertFalse(self.env["product.timeline.queue"].search([]))
+        # rename Partner A
+        self.partnerA.name = "Timeline Partner A Renamed"
+        self.assertEqual(set(timelines.mapped("name")), {"Timeline Partner A"})
+        # the timelines are recomputed by the flush of the queue
+        self.env["product.timeline.queue"]._flush()
+        self.assertFalse(self.env["product.timeline.queue"].search([]))
+        self.assertEqual(set(timelines.mapped("name")), {self.partnerA.name})
+        self.assertEqual(
+            sorted(timelines.mapped("price_subtotal")),
+            sorted(lines.mapped("price_subtotal")),
+        )
+
+    def test_04_search_read_window(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_2)
+        # rental orders
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_2 = self._create_rental_order(
+            self.partnerA.id, self.date_0111, self.date_0111
+        )
+        timeline_1 = rental_order_1.order_line.timeline_ids
+        timeline_2 = rental_order_2.order_line.timeline_ids
+        TimelineObj = self.env["product.timeline"]
+        domain = [("product_id", "=", self.product_rental_2.id)]
+        items = TimelineObj.search_read_window(
+            domain, ["id"], "2022-01-05 00:00:00", "2022-01-06 00:00:00"
+        )
+        self.assertEqual([item["id"] for item in items], timeline_1.ids)
+        items = TimelineObj.search_read_window(
+            domain, ["id"], "2022-01-10 00:00:00", "2022-01-20 00:00:00"
+        )
+        self.assertEqual(
+            sorted(item["id"] for item in items), sorted((timeline_1 | timeline_2).ids)
+        )
+
+    def test_05_timeline_groups(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_3)
+        partnerB = self.PartnerObj.create({"name": "Timeline Partner B"})
+        # rental orders of two partners for the same product
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_2 = self._create_rental_order(
+            partnerB.id, self.date_0102, self.date_0111
+        )
+        timelines = (rental_order_1 | rental_order_2).mapped("order_line.timeline_ids")
+        domain = [("id", "in", timelines.ids)]
+        TimelineObj = self.env["product.timeline"]
+        product_id = self.product_rental_3.id
+        # grouped by product
+        res = TimelineObj.get_timeline_groups(domain, "product_id")
+        self.assertEqual([group["id"] for group in res["groups"]], [product_id])
+        # only the items of the loaded window are grouped
+        res = TimelineObj.get_timeline_groups(
+            domain, "product_id", date_start="2022-01-12 00:00:00"
+        )
+        self.assertFalse(res["groups"])
+        # grouped by category
+        res = TimelineObj.get_timeline_groups(domain, "product_categ_id")
+        self.assertEqual(len(res["groups"]), 2)
+        self.assertEqual(res["groups"][1]["nestedGroups"], [product_id])
+        self.assertGreater(res["groups"][1]["id"], product_id)
+        # grouped by partner, the product gets a group under each partner
+        res = TimelineObj.get_timeline_groups(domain, "partner_id")
+        self.assertEqual(len(res["groups"]), 4)
+        group_a = res["item_groups"]["%s,%s" % (product_id, self.partnerA.id)]
+        group_b = res["item_groups"]["%s,%s" % (product_id, partnerB.id)]
+        self.assertNotEqual(group_a, group_b)
+        self.assertEqual(
+            len({group["id"] for group in res["groups"]}), len(res["groups"])
+        )
+        nested_groups = [
+            group["nestedGroups"] for group in res["groups"] if "nestedGroups" in group
+        ]
+        self.assertEqual(sorted(nested_groups), sorted([[group_a], [group_b]]))
+
+    def test_06_utilization_buckets(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_3)
+        self.env["stock.quant"]._update_available_quantity(
+            self.product_rental_3, self.warehouse0.rental_in_location_id, 4
+        )
+        # two rental orders of ten days for 1 and 2 units of the same product
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_2 = self._create_rental_order(
+            self.partnerA.id, self.date_0102, self.date_0111, qty=2
+        )
+        timelines = (rental_order_1 | rental_order_2).mapped("order_line.timeline_ids")
+        domain = [("id", "in", timelines.ids)]
+        TimelineObj = self.env["product.timeline"]
+        res = TimelineObj.get_utilization_buckets(
+            domain, "2022-01-01", "2022-01-31", interval="month"
+        )
+        self.assertEqual(
+            res["groups"],
+            [{"id": self.product_rental_3.id, "content": self.product_rental_3.name}],
+        )
+        self.assertEqual(len(res["buckets"]), 1)
+        bucket = res["buckets"][0]
+        self.assertEqual(bucket["start"], "2022-01-01")
+        self.assertEqual(bucket["end"], "2022-02-01")
+        self.assertEqual(bucket["items"], 2)
+        # 30 unit days rented out of the 4 units during 31 days
+        self.assertAlmostEqual(bucket["utilization"], 30 / (31.0 * 4))
+        # the days of the window only are counted
+        res = TimelineObj.get_utilization_buckets(
+            domain,
+            "2022-01-01",
+            "2022-01-05",
+            group_by="product_categ_id",
+            interval="day",
+        )
+        self.assertEqual(
+            [group["id"] for group in res["groups"]], [self.category_all.id]
+        )
+        self.assertEqual(
+            [bucket["utilization"] for bucket in res["buckets"]],
+            [0.25, 0.75, 0.75, 0.75, 0.75],
+        )
+
+    def test_07_rebuild_timelines(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_1)
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_1.action_confirm()
+        rental_order_2 = self._create_rental_order(
+            self.partnerA.id, self.date_0102, self.date_0111
+        )
+        line_1 = rental_order_1.order_line
+        line_2 = rental_order_2.order_line
+        timeline_2 = line_2.timeline_ids
+        # drift of the timeline of the first order
+        line_1.timeline_ids.unlink()
+        self.assertFalse(line_1.timeline_ids)
+        rental_order_1.action_rebuild_timeline()
+        line_1.invalidate_cache()
+        timeline_1 = line_1.timeline_ids
+        self.assertEqual(len(timeline_1), 1)
+        self.assertEqual(timeline_1.type, "rental")
+        self.assertEqual(timeline_1.product_id, self.product_rental_1)
+        self.assertEqual(timeline_1.product_categ_id, self.category_all)
+        self.assertEqual(timeline_1.order_name, rental_order_1.name)
+        self.assertEqual(timeline_1.partner_id, self.partnerA)
+        self.assertEqual(timeline_1.product_name, self.product_rental_1.display_name)
+        # the rental ended long ago is rebuilt as archived history
+        self.assertTrue(timeline_1.history)
+        self.assertFalse(timeline_1.active)
+        # the timelines of the other orders are kept
+        self.assertTrue(timeline_2.exists())
+        # rebuild of everything
+        count = self.env["product.timeline"]._rebuild_sale_line_timelines()
+        self.assertGreaterEqual(count, 2)
+        line_2.invalidate_cache()
+        self.assertFalse(timeline_2.exists())
+        self.assertEqual(len(line_2.timeline_ids), 1)
+        self.assertEqual(line_2.timeline_ids.type, "reserved")
+
+    def test_08_mass_order_actions(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_2)
+        orders = self.env["sale.order"]
+        for _i in range(3):
+            orders |= self._create_rental_order(
+                self.partnerA.id, self.date_0101, self.date_0110
+            )
+        lines = orders.mapped("order_line")
+        self.assertEqual(len(lines.mapped("timeline_ids")), 3)
+        orders.action_cancel()
+        lines.invalidate_cache()
+        self.assertFalse(lines.mapped("timeline_ids"))
+        orders.action_draft()
+        lines.invalidate_cache()
+        timelines = lines.mapped("timeline_ids")
+        self.assertEqual(len(timelines), 3)
+        self.assertEqual(set(timelines.mapped("type")), {"reserved"})
+        orders.action_confirm()
+        self.assertEqual(set(timelines.mapped("type")), {"rental"})
+
+    def test_09_push_changes(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_1)
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        timeline = rental_order_1.order_line.timeline_ids
+        # the changes are collected until the end of the transaction
+        changes = TIMELINE_CHANGES[self.env.cr]
+        self.assertIn(timeline.id, changes["created"])
+        rental_order_1.action_confirm()
+        self.assertIn(timeline.id, changes["updated"])
+        self.assertIn("type", changes["fields"])
+        rental_order_1.action_cancel()
+        self.assertIn(timeline.id, changes["deleted"])
+        # the clients reload instead of reading too many changed objects
+        TimelineObj = self.env["product.timeline"]
+        message = TimelineObj._get_changes_message(changes)
+        self.assertEqual(message["deleted"], [timeline.id])
+        many_changes = dict(changes, created=set(range(1, TIMELINE_MAX_CHANGES + 2)))
+        message = TimelineObj._get_changes_message(many_changes)
+        self.assertEqual(message, {"reload": True})
+
+    def test_10_tooltip_values(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_1)
+        rental_order_1 = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        rental_order_1.action_confirm()
+        timeline = rental_order_1.order_line.timeline_ids
+        values = timeline.get_tooltip_values()
+        self.assertEqual(values["id"], timeline.id)
+        self.assertEqual(values["order_name"], rental_order_1.name)
+        self.assertEqual(values["type_formated"], "Confirmed Order")
+        self.assertEqual(values["partner_id"][0], self.partnerA.id)
+        self.assertEqual(values["rental_period"], timeline.rental_period)
+        self.assertTrue(values["date_start_formated"])
+        self.assertTrue(values["amount"])
+
+    def test_11_archive_history(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_2)
+        today = fields.Date.from_string(fields.Date.today())
+        old_order = self._create_rental_order(
+            self.partnerA.id, self.date_0101, self.date_0110
+        )
+        recent_order = self._create_rental_order(
+            self.partnerA.id, today, today + relativedelta(days=9)
+        )
+        old_timeline = old_order.order_line.timeline_ids
+        recent_timeline = recent_order.order_line.timeline_ids
+        TimelineObj = self.env["product.timeline"]
+        domain = [("id", "in", (old_timeline | recent_timeline).ids)]
+        TimelineObj._archive_history(months=12)
+        self.assertTrue(old_timeline.history)
+        self.assertFalse(old_timeline.active)
+        self.assertFalse(recent_timeline.history)
+        self.assertEqual(TimelineObj.search(domain), recent_timeline)
+        # the history is included on demand
+        history_domain = domain + ["|", ("active", "=", True), ("history", "=", True)]
+        self.assertEqual(
+            TimelineObj.search(history_domain), old_timeline | recent_timeline
+        )
+        # the timeline of the order line is still found
+        old_order.order_line.invalidate_cache()
+        self.assertEqual(old_order.order_line.timeline_ids, old_timeline)
+        # a rental extended to a date long ago is still history
+        old_timeline.date_end = "2022-01-11 00:00:00"
+        self.assertTrue(old_timeline.history)
+        self.assertFalse(old_timeline.active)
+        # a rental extended to today is not history anymore
+        old_timeline.date_end = fields.Datetime.now()
+        self.assertFalse(old_timeline.history)
+        self.assertTrue(old_timeline.active)
+        # the archived timeline objects are deleted with the order
+        old_timeline.date_end = "2022-01-10 00:00:00"
+        TimelineObj._archive_history(months=12)
+        self.assertFalse(old_timeline.active)
+        old_order.action_cancel()
+        self.assertFalse(old_timeline.exists())
+
+    def test_12_export_rows(self):
+        # rental service product
+        self.service_rental = self._create_rental_service_day(self.product_rental_3)
+        orders = self.env["sale.order"]
+        for _i in range(3):
+            orders |= self._create_rental_order(
+                self.partnerA.id, self.date_0101, self.date_0110
+            )
+        timelines = orders.mapped("order_line.timeline_ids")
+        TimelineObj = self.env["product.timeline"]
+        query, params = TimelineObj._get_export_query([("id", "in", timelines.ids)])
+        batches = list(TimelineObj._iter_export_rows(query, params, batch_size=2))
+        self.assertEqual([len(rows) for rows in batches], [2, 1])
+        rows = batches[0] + batches[1]
+        self.assertEqual(sorted(row[0] for row in rows), sorted(timelines.ids))
+        self.assertEqual(rows[0][4], self.product_rental_3.display_name)
+        self.assertEqual(rows[0][6], self.partnerA.name)
+        # the server-side cursor is closed, another export can be run
+        batches = list(TimelineObj._iter_export_rows(query, params))
+        self.assertEqual(len(batches), 1)
+        # all-day events ending the day after the last rental day
+        ics = "".join(_ical_chunks(batches, self.env.cr.dbname))
+        self.assertIn("DTSTART;VALUE=DATE:20220101\r\n", ics)
+        self.assertIn("DTEND;VALUE=DATE:20220111\r\n", ics)